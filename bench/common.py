@@ -0,0 +1,69 @@
+import json
+import os
+import platform
+import socket
+import subprocess
+import time
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    # Ask the kernel for an unused UDP port, it stays free long enough for
+    # the next bind on loopback
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def revision() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return output.stdout.strip()
+
+
+def environment() -> dict:
+    return {
+        'revision': revision(),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    }
+
+
+def save(path: str, kind: str, arguments: dict, results: list[dict]):
+    document = {
+        'kind': kind,
+        'environment': environment(),
+        'arguments': arguments,
+        'results': results
+    }
+
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2)
+
+    print(f'[!] Results written to {path}')
+
+
+def parse_size(text: str) -> int:
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper()
+
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+
+    return int(text)
+
+
+def parse_list(text: str, cast=str) -> list:
+    return [cast(item) for item in text.split(',') if item.strip()]
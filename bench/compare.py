@@ -0,0 +1,59 @@
+import argparse
+import json
+import statistics
+
+# Result fields that identify a measurement and the one compared across runs
+KEYS = {
+    'micro': (['name', 'payload_size'], 'best', False),
+    'e2e': (['scenario', 'file', 'window', 'loss', 'protocol'], 'throughput', True)
+}
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def group(document: dict) -> dict:
+    fields, value, _ = KEYS[document['kind']]
+
+    groups = {}
+    for result in document['results']:
+        key = tuple(result[field] for field in fields)
+        groups.setdefault(key, []).append(result[value])
+
+    return {key: statistics.median(values) for key, values in groups.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    baseline = load(args.baseline)
+    candidate = load(args.candidate)
+
+    if baseline['kind'] != candidate['kind']:
+        raise SystemExit(f'[X] Cannot compare {baseline["kind"]} results with {candidate["kind"]} results')
+
+    _, value, higher_is_better = KEYS[baseline['kind']]
+    before = group(baseline)
+    after = group(candidate)
+
+    print(f'[!] {baseline["environment"]["revision"]} -> {candidate["environment"]["revision"]} | {value}')
+    for key in before:
+        if key not in after:
+            continue
+
+        if before[key] == 0 or after[key] == 0:
+            change = 'n/a'
+        else:
+            ratio = after[key] / before[key] if higher_is_better else before[key] / after[key]
+            change = f'{ratio:.2f}x'
+
+        print(f'[!] {" | ".join(str(field) for field in key):<50} | {before[key]:.6g} -> {after[key]:.6g} | {change}')
+
+
+if __name__ == '__main__':
+    main()
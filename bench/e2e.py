@@ -0,0 +1,315 @@
+import argparse
+import filecmp
+import functools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import ROOT, free_port, parse_list, parse_size, save
+from lib.impairment import Impairment
+from lib.proxy import Proxy, FORWARD, BACKWARD
+
+SAMPLES = ['test/is_it_over_now.txt', 'test/hasad.jpg', 'test/sayang.mp4']
+
+# Time given to a listening process to bind before the other side starts
+STARTUP_DELAY = 0.3
+
+# Random input files are written a piece at a time so the harness stays small
+GENERATE_CHUNK_SIZE = 1024 * 1024
+
+# ru_maxrss of a child starts at the parent's high-water mark across fork and
+# exec, so every child records the VmHWM of its own address space at exit
+RSS_RUNNER = '''
+import atexit, resource, runpy, sys
+
+def record(path=sys.argv[1]):
+    try:
+        with open('/proc/self/status') as f:
+            peak = next(int(line.split()[1]) for line in f if line.startswith('VmHWM:'))
+    except (OSError, StopIteration):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    with open(path, 'w') as f:
+        f.write(str(peak))
+
+atexit.register(record)
+sys.argv = sys.argv[2:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+'''
+
+
+class Process:
+    role: str
+    started_at: float
+    finished_at: Optional[float]
+    exit_code: Optional[int]
+    peak_rss_kb: Optional[int]
+
+    def __init__(self, role: str, workdir: str, arguments: list[str], stdin: Optional[bytes] = None):
+        self.role = role
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.exit_code = None
+        self.peak_rss_kb = None
+        self.usage = None
+        self.__rss_path = os.path.join(workdir, f'{role}.rss')
+
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', RSS_RUNNER, self.__rss_path] + arguments,
+            cwd=ROOT,
+            stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        if stdin is not None:
+            self.process.stdin.write(stdin)
+            self.process.stdin.close()
+
+        # wait4 is the only way to get the resource usage of one child, so
+        # the child is reaped here instead of through Popen
+        self.__thread = threading.Thread(target=self.__wait, daemon=True)
+        self.__thread.start()
+
+    def __wait(self):
+        _, status, usage = os.wait4(self.process.pid, 0)
+        self.finished_at = time.monotonic()
+        self.exit_code = os.waitstatus_to_exitcode(status)
+        self.usage = usage
+        self.process.returncode = self.exit_code
+
+        try:
+            with open(self.__rss_path) as f:
+                self.peak_rss_kb = int(f.read())
+        except (OSError, ValueError):
+            pass
+
+    def wait(self, deadline: float) -> bool:
+        self.__thread.join(max(0.0, deadline - time.monotonic()))
+
+        if self.__thread.is_alive():
+            self.process.kill()
+            self.__thread.join()
+            return False
+
+        return True
+
+    def report(self) -> dict:
+        return {
+            'exit_code': self.exit_code,
+            'seconds': self.finished_at - self.started_at,
+            'cpu_seconds': self.usage.ru_utime + self.usage.ru_stime,
+            'peak_rss_kb': self.peak_rss_kb
+        }
+
+
+def read_metrics(path: str) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def total(metrics: dict, name: str) -> int:
+    return sum(data.get(name, 0) for data in metrics.values())
+
+
+def route(port: int, loss: float, seed: int, proxies: list[Proxy]) -> int:
+    # Lossless runs talk directly, lossy ones go through a proxy that drops
+    # datagrams in both directions
+    if loss <= 0:
+        return port
+
+    impairment = Impairment(loss=loss)
+    proxy = Proxy(free_port(), port, impairment, impairment, seed + len(proxies))
+    proxy.start()
+    proxies.append(proxy)
+
+    return proxy.port
+
+
+def run_client_server(workdir: str, input_path: str, options: list[str], loss: float, seed: int, timeout: float):
+    server_port = free_port()
+    client_port = free_port()
+    output_path = os.path.join(workdir, 'client.out')
+    server_metrics = os.path.join(workdir, 'server.json')
+
+    proxies = []
+    target = route(server_port, loss, seed, proxies)
+
+    server = Process('server', workdir, [
+        'server.py', str(server_port), input_path, '--metrics', server_metrics, '--log-level', 'error'
+    ] + options, stdin=b'n\n')
+    time.sleep(STARTUP_DELAY)
+
+    client = Process('client', workdir, [
+        'client.py', str(client_port), str(target), output_path, '--log-level', 'error'
+    ])
+
+    deadline = time.monotonic() + timeout
+    finished = client.wait(deadline) and server.wait(deadline)
+
+    for proxy in proxies:
+        proxy.stop()
+
+    return {
+        'finished': finished,
+        'seconds': (client.finished_at or time.monotonic()) - client.started_at,
+        'bytes': os.path.getsize(input_path),
+        'valid': finished and filecmp.cmp(input_path, output_path, shallow=False),
+        'processes': [server, client],
+        'metrics': [read_metrics(server_metrics)],
+        'proxies': proxies
+    }
+
+
+def run_peer(
+    workdir: str, input_path: str, options: list[str], loss: float, seed: int, timeout: float, duplex: bool = False
+):
+    ports = [free_port(), free_port()]
+    if duplex:
+        options = options + ['--duplex']
+
+    proxies = []
+    targets = [route(ports[1], loss, seed, proxies), route(ports[0], loss, seed, proxies)]
+
+    # The first peer to time out waiting for a SYN becomes the sender, so
+    # the second one has to start while the first is still listening
+    peers = []
+    for index in range(2):
+        if index > 0:
+            time.sleep(STARTUP_DELAY)
+
+        output_path = os.path.join(workdir, f'peer_{index}.out')
+        metrics_path = os.path.join(workdir, f'peer_{index}.json')
+
+        peers.append(Process(f'peer_{index}', workdir, [
+            'peer.py', str(ports[index]), str(targets[index]), input_path, output_path,
+            '--metrics', metrics_path, '--log-level', 'error'
+        ] + options))
+
+    deadline = time.monotonic() + timeout
+    finished = all([peer.wait(deadline) for peer in peers])
+
+    for proxy in proxies:
+        proxy.stop()
+
+    end = max(peer.finished_at or time.monotonic() for peer in peers)
+    valid = finished and all(
+        filecmp.cmp(input_path, os.path.join(workdir, f'peer_{index}.out'), shallow=False) for index in range(2)
+    )
+
+    return {
+        'finished': finished,
+        'seconds': end - peers[0].started_at,
+        'bytes': 2 * os.path.getsize(input_path),
+        'valid': valid,
+        'processes': peers,
+        'metrics': [read_metrics(os.path.join(workdir, f'peer_{index}.json')) for index in range(2)],
+        'proxies': proxies
+    }
+
+
+SCENARIOS = {
+    'client-server': run_client_server,
+    'peer': run_peer,
+    'peer-duplex': functools.partial(run_peer, duplex=True)
+}
+
+
+def run(scenario: str, input_path: str, window: int, loss: float, protocol: str, seed: int, timeout: float) -> dict:
+    options = ['--protocol', protocol, '--max-window', str(window)]
+
+    with tempfile.TemporaryDirectory() as workdir:
+        outcome = SCENARIOS[scenario](workdir, input_path, options, loss, seed, timeout)
+
+    processes = outcome['processes']
+    finished = [process for process in processes if process.usage is not None]
+    seconds = outcome['seconds']
+
+    return {
+        'scenario': scenario,
+        'file': os.path.basename(input_path),
+        'size': os.path.getsize(input_path),
+        'window': window,
+        'loss': loss,
+        'protocol': protocol,
+        'seed': seed,
+        'finished': outcome['finished'],
+        'valid': outcome['valid'],
+        'seconds': seconds,
+        'throughput': outcome['bytes'] / seconds if outcome['finished'] and seconds > 0 else 0.0,
+        'cpu_seconds': sum(process.report()['cpu_seconds'] for process in finished),
+        'peak_rss_kb': max((process.peak_rss_kb or 0 for process in finished), default=0),
+        'retransmissions': sum(total(metrics, 'retransmissions') for metrics in outcome['metrics']),
+        'timeouts': sum(total(metrics, 'timeouts') for metrics in outcome['metrics']),
+        'dropped': sum(
+            proxy.stats[direction]['dropped'] for proxy in outcome['proxies'] for direction in [FORWARD, BACKWARD]
+        ),
+        'processes': {process.role: process.report() for process in finished}
+    }
+
+
+def generate(directory: str, size: int, seed: int) -> str:
+    path = os.path.join(directory, f'random_{size}.bin')
+    generator = random.Random(seed)
+    with open(path, 'wb') as f:
+        for offset in range(0, size, GENERATE_CHUNK_SIZE):
+            f.write(generator.randbytes(min(GENERATE_CHUNK_SIZE, size - offset)))
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenarios', type=parse_list, default=list(SCENARIOS))
+    parser.add_argument('--files', type=parse_list, default=SAMPLES)
+    parser.add_argument('--sizes', type=lambda text: parse_list(text, parse_size), default=[])
+    parser.add_argument('--windows', type=lambda text: parse_list(text, int), default=[16, 64])
+    parser.add_argument('--losses', type=lambda text: parse_list(text, float), default=[0.0, 0.02])
+    parser.add_argument('--protocols', type=parse_list, default=['sr'])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        files = [os.path.join(ROOT, path) for path in args.files]
+        files += [generate(directory, size, args.seed) for size in args.sizes]
+
+        for scenario in args.scenarios:
+            for input_path in files:
+                for window in args.windows:
+                    for loss in args.losses:
+                        for protocol in args.protocols:
+                            for index in range(args.repeat):
+                                result = run(
+                                    scenario, input_path, window, loss, protocol, args.seed + index, args.timeout
+                                )
+                                results.append(result)
+
+                                print(
+                                    f'[{"!" if result["valid"] else "X"}] {scenario:<13} | {result["file"]:<20} | '
+                                    f'window {window:>3} | loss {loss:.2f} | {protocol} | '
+                                    f'{result["seconds"]:7.2f} s | {result["throughput"] / 1e6:7.2f} MB/s | '
+                                    f'cpu {result["cpu_seconds"]:6.2f} s | {result["peak_rss_kb"] / 1024:6.1f} MB | '
+                                    f'{result["retransmissions"]} retransmissions'
+                                )
+
+    if args.output is not None:
+        save(args.output, 'e2e', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
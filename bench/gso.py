@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.connection import Connection
+from lib.segment import Segment
+
+
+def make_segments(count: int, payload_size: int) -> list[Segment]:
+    segments = []
+    for seq_num in range(count):
+        segments.append(Segment.data(seq_num, os.urandom(payload_size)))
+
+    return segments
+
+
+def run(port: int, segments: list[Segment], window: int, offload: bool) -> dict:
+    sender = Connection(ip='localhost', port=port)
+    receiver = Connection(ip='localhost', port=port + 1)
+
+    if offload:
+        sender.enable_offload(len(segments[0]))
+        receiver.enable_offload(len(segments[0]))
+
+    receiver.socket.settimeout(1)
+
+    received = 0
+    start = time.perf_counter()
+
+    for offset in range(0, len(segments), window):
+        batch = segments[offset:offset + window]
+        sender.send_segments(receiver.ip, receiver.port, batch)
+
+        for _ in batch:
+            message = receiver.listen()
+            receiver.release(message)
+            received += 1
+
+    elapsed = time.perf_counter() - start
+
+    result = {
+        'offload': offload,
+        'gso': sender.gso,
+        'gro': receiver.gro,
+        'segments': received,
+        'send_calls': sender.send_calls,
+        'receive_calls': receiver.receive_calls,
+        'seconds': elapsed
+    }
+
+    sender.close()
+    receiver.close()
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=45000)
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--payload-size', type=int, default=1200)
+    parser.add_argument('--window', type=int, default=32)
+    args = parser.parse_args()
+
+    segments = make_segments(args.count, args.payload_size)
+
+    print(f'[!] {args.count} segments | {args.payload_size} byte payload | window {args.window}')
+    for offload in [False, True]:
+        result = run(args.port, segments, args.window, offload)
+        rate = result['segments'] / result['seconds']
+
+        print(
+            f'[!] offload {"on " if offload else "off"} | gso {result["gso"]} | gro {result["gro"]} | '
+            f'{result["send_calls"]} send calls | {result["receive_calls"]} receive calls | '
+            f'{result["seconds"]:.3f} s | {rate:.0f} segments/s'
+        )
+
+
+if __name__ == '__main__':
+    main()
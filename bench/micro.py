@@ -0,0 +1,118 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.common import free_port, parse_list, save
+from lib.connection import Connection
+from lib.constant import PAYLOAD_SIZE
+from lib.segment import Segment
+
+# Segments kept in flight per listen round, well under the socket buffer
+LISTEN_BATCH = 32
+
+
+def measure(function, number: int, repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+
+    return timings
+
+
+def bench_checksum(segment: Segment, number: int, repeat: int) -> list[float]:
+    return measure(segment.calculate_checksum, number, repeat)
+
+
+def bench_get_bytes(segment: Segment, number: int, repeat: int) -> list[float]:
+    return measure(segment.get_bytes, number, repeat)
+
+
+def bench_listen(segment: Segment, number: int, repeat: int) -> list[float]:
+    # Only the listen calls are timed, the datagrams are queued on the
+    # receiving socket beforehand so every call finds one waiting
+    sender = Connection(ip='localhost', port=free_port())
+    receiver = Connection(ip='localhost', port=free_port())
+    receiver.socket.settimeout(1)
+
+    timings = []
+    for _ in range(repeat):
+        elapsed = 0.0
+        for offset in range(0, number, LISTEN_BATCH):
+            count = min(LISTEN_BATCH, number - offset)
+            for _ in range(count):
+                sender.send_segment(receiver.ip, receiver.port, segment)
+
+            start = time.perf_counter()
+            for _ in range(count):
+                receiver.release(receiver.listen())
+            elapsed += time.perf_counter() - start
+
+        timings.append(elapsed / number)
+
+    sender.close()
+    receiver.close()
+
+    return timings
+
+
+BENCHMARKS = {
+    'checksum': bench_checksum,
+    'get_bytes': bench_get_bytes,
+    'listen': bench_listen
+}
+
+
+def run(name: str, payload_size: int, number: int, repeat: int, seed: int) -> dict:
+    payload = random.Random(seed).randbytes(payload_size)
+    segment = Segment.data(1, payload)
+
+    timings = BENCHMARKS[name](segment, number, repeat)
+    best = min(timings)
+
+    return {
+        'name': name,
+        'payload_size': payload_size,
+        'number': number,
+        'repeat': repeat,
+        'best': best,
+        'median': statistics.median(timings),
+        'ops_per_second': 1 / best,
+        'bytes_per_second': len(segment) / best
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmarks', type=parse_list, default=list(BENCHMARKS))
+    parser.add_argument('--payload-sizes', type=lambda text: parse_list(text, int), default=[64, 1200, PAYLOAD_SIZE])
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None)
+    args = parser.parse_args()
+
+    results = []
+    for name in args.benchmarks:
+        for payload_size in args.payload_sizes:
+            result = run(name, payload_size, args.number, args.repeat, args.seed)
+            results.append(result)
+
+            print(
+                f'[!] {name:<10} | {payload_size:>6} byte payload | {result["best"] * 1e6:10.2f} us/op | '
+                f'{result["ops_per_second"]:10.0f} ops/s | {result["bytes_per_second"] / 1e6:8.1f} MB/s'
+            )
+
+    if args.output is not None:
+        save(args.output, 'micro', vars(args), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,24 @@
-import sys
+import argparse
+import os
 import struct
+import time
 from dataclasses import dataclass
+from typing import Optional, Union
 
-from lib.connection import Node, Connection, MessageInfo
-from lib.constant import TIMEOUT, BLOCKING
+from lib.connection import Node, Connection, MessageInfo, parse_address
+from lib.checkpoint import Checkpoint
+from lib.compression import get_codec
+from lib.constant import BLOCKING, CHECKPOINT_SIZE, LOG_LEVEL, LOG_RATE_LIMIT
+from lib.delta import Signatures
 from lib.exception import InvalidChecksumError
+from lib.log import LEVELS, get_logger, setup_logging
+from lib.manifest import Manifest
+from lib.options import HandshakeOptions
+from lib.receiver import create_reorder_buffer
 from lib.segment import Segment
+from lib.writer import FileWriter, DirectoryWriter, DeltaWriter
+
+log = get_logger(__name__)
 
 
 @dataclass
@@ -13,21 +26,60 @@ class Client(Node):
     server_ip: str
     server_port: int
     output_path: str
-
-    def __init__(self, server_ip: str, server_port: int, output_path: str, ip: str = "localhost", port: int = 3000):
+    options: HandshakeOptions
+    metrics_path: Optional[str]
+    checkpoint: Optional[Checkpoint]
+    versions: list[bytes]
+    delta: bool
+    signatures: Optional[Signatures]
+
+    def __init__(
+            self,
+            server_ip: str,
+            server_port: int,
+            output_path: str,
+            ip: str = "localhost",
+            port: int = 3000,
+            group: Optional[tuple[str, int]] = None,
+            offload: bool = False,
+            metrics_path: Optional[str] = None,
+            delta: bool = False
+    ):
         super().__init__()
 
         self.connection = Connection(ip=ip, port=port)
-        print(f'[!] Client started at {self.connection.ip}:{self.connection.port}')
+        log.info('Client started at %s:%s', self.connection.ip, self.connection.port)
+
+        if offload:
+            self.__enable_offload()
+
+        if group is not None:
+            self.connection.join_group(group[0], group[1])
+            log.info('Joined multicast group %s:%s', group[0], group[1])
 
         self.server_ip = server_ip
         self.server_port = server_port
         self.output_path = output_path
+        self.options = HandshakeOptions()
+        self.metrics_path = metrics_path
+        self.checkpoint = None
+        self.versions = []
+        self.delta = delta
+        self.signatures = None
+
+    def __enable_offload(self):
+        if self.connection.enable_offload():
+            log.info('UDP offload | gso %s | gro %s', self.connection.gso, self.connection.gro)
+        else:
+            log.warning('UDP offload is not supported, sending one segment per syscall')
 
     def run(self):
-        print(f'[!] Initiating request to {self.server_ip}:{self.server_port}...')
+        self.connection.metrics.install_signal_handler(self.metrics_path)
+
+        log.info('Initiating request to %s:%s...', self.server_ip, self.server_port)
         self.__three_way_handshake()
         self.__receive_data()
+        self.connection.metrics.dump(self.metrics_path)
 
     def __three_way_handshake(self):
         self.__send_syn()
@@ -41,45 +93,47 @@ class Client(Node):
             segment=Segment.syn(0)
         )
 
-        print()
-        print(f'[!] [Request] Sending SYN request to {self.server_ip}:{self.server_port}')
+        log.info('[Request] Sending SYN request to %s:%s', self.server_ip, self.server_port)
 
         self.connection.send(self.server_ip, self.server_port, syn_message)
+        sent_at = time.monotonic()
 
         while True:
             try:
-                print(f'[!] [Request] Waiting for response...')
-                self.connection.socket.settimeout(TIMEOUT)
+                log.info('[Request] Waiting for response...')
+                self.connection.socket.settimeout(self.connection.rtt.rto)
                 ack_message = self.connection.listen()
 
                 ip = ack_message.ip
                 port = ack_message.port
                 segment = ack_message.segment
 
-                if segment == Segment.ack(0, 0):
-                    print(f'[!] [Request] Received ACK response from {ip}:{port}')
-                    print(f'[!] [Request] Client request successfully added to server ')
+                if segment.is_ack() and segment.ack_num == 0:
+                    log.info('[Request] Received ACK response from %s:%s', ip, port)
+                    self.__sample_rtt(sent_at)
+                    log.info('[Request] Client request successfully added to server')
                     break
                 else:
-                    print(f'[X] [Request] Unknown segment received')
-                    print(f'[!] [Request] Retransmit SYN request to {self.server_ip}:{self.server_port}')
+                    log.warning('[Request] Unknown segment received')
+                    log.info('[Request] Retransmit SYN request to %s:%s', self.server_ip, self.server_port)
 
             except TimeoutError as e:
-                print(f'[X] [Request] Timeout error: {e}')
-                print(f'[!] [Request] Retransmit SYN request to {self.server_ip}:{self.server_port}')
+                log.warning('[Request] Timeout error: %s', e)
+                log.info('[Request] Retransmit SYN request to %s:%s', self.server_ip, self.server_port)
 
+                self.connection.rtt.backoff()
                 self.connection.send(self.server_ip, self.server_port, syn_message)
+                sent_at = None
 
             except InvalidChecksumError as e:
-                print(f'[X] [Request] Checksum error: {e}')
-                print(f'[!] [Request] Retransmit SYN request to {self.server_ip}:{self.server_port}')
+                log.warning('[Request] Checksum error: %s', e)
+                log.info('[Request] Retransmit SYN request to %s:%s', self.server_ip, self.server_port)
 
                 self.connection.send(self.server_ip, self.server_port, syn_message)
-
-        print()
+                sent_at = None
 
     def __wait_syn_req(self):
-        print(f'[!] [Handshake] Waiting for SYN request...')
+        log.info('[Handshake] Waiting for SYN request...')
 
         while True:
             self.connection.socket.settimeout(BLOCKING)
@@ -89,134 +143,330 @@ class Client(Node):
             port = syn_message.port
             segment = syn_message.segment
 
-            if segment == Segment.syn(0):
-                print(f'[!] [Handshake] Received SYN response from {ip}:{port}')
+            if segment.is_syn():
+                log.info('[Handshake] Received SYN response from %s:%s', ip, port)
+                options = HandshakeOptions.from_bytes(segment.payload)
+                self.options = options.accept()
+                self.__resume(options.versions)
+                self.__send_signatures()
                 break
             else:
-                print(f'[X] [Handshake] Unknown segment received')
+                log.warning('[Handshake] Unknown segment received')
 
     def __send_syn_ack(self):
         syn_ack_message = MessageInfo(
             ip=self.connection.ip,
             port=self.connection.port,
-            segment=Segment.syn_ack()
+            segment=Segment.syn_ack(self.options.get_bytes())
         )
 
-        print()
-        print(f'[!] [Handshake] Sending SYN ACK request to {self.server_ip}:{self.server_port}')
+        log.info('[Handshake] Sending SYN ACK request to %s:%s', self.server_ip, self.server_port)
 
         self.connection.send(self.server_ip, self.server_port, syn_ack_message)
+        sent_at = time.monotonic()
 
         while True:
             try:
-                print(f'[!] [Handshake] Waiting for response...')
+                log.info('[Handshake] Waiting for response...')
 
-                self.connection.socket.settimeout(TIMEOUT)
+                self.connection.socket.settimeout(self.connection.rtt.rto)
                 ack_message = self.connection.listen()
 
                 ip = ack_message.ip
                 port = ack_message.port
                 segment = ack_message.segment
 
-                if segment == Segment.ack(0, 0):
-                    print(f'[!] [Handshake] Received ACK response from {ip}:{port}')
+                if segment.is_ack() and segment.ack_num == 0:
+                    log.info('[Handshake] Received ACK response from %s:%s', ip, port)
+                    self.__sample_rtt(sent_at)
                     break
                 else:
-                    print(f'[!] [Handshake] Unknown segment received')
-                    print(f'[!] [Handshake] Retransmit SYN ACK request to {self.server_ip}:{self.server_port}')
+                    log.info('[Handshake] Unknown segment received')
+                    log.info('[Handshake] Retransmit SYN ACK request to %s:%s', self.server_ip, self.server_port)
 
             except TimeoutError as e:
-                print(f'[X] [Handshake] Timeout error: {e}')
-                print(f'[!] [Handshake] Retransmit SYN ACK request to {self.server_ip}:{self.server_port}')
+                log.warning('[Handshake] Timeout error: %s', e)
+                log.info('[Handshake] Retransmit SYN ACK request to %s:%s', self.server_ip, self.server_port)
 
+                self.connection.rtt.backoff()
                 self.connection.send(self.server_ip, self.server_port, syn_ack_message)
+                sent_at = None
 
             except InvalidChecksumError as e:
-                print(f'[X] [Handshake] Checksum error: {e}')
-                print(f'[!] [Handshake] Retransmit SYN ACK request to {self.server_ip}:{self.server_port}')
+                log.warning('[Handshake] Checksum error: %s', e)
+                log.info('[Handshake] Retransmit SYN ACK request to %s:%s', self.server_ip, self.server_port)
 
                 self.connection.send(self.server_ip, self.server_port, syn_ack_message)
+                sent_at = None
+
+    def __sample_rtt(self, sent_at: Optional[float]):
+        # Karn's rule: a reply to a retransmitted request is not timed
+        if sent_at is not None:
+            self.connection.rtt.sample(time.monotonic() - sent_at)
+
+        log.info('RTT to %s:%s | %s', self.server_ip, self.server_port, self.connection.rtt)
+
+    def __resume(self, versions: list[bytes]):
+        # Streams of unchanged files continue after the last segment that was
+        # safely on disk when the previous run stopped
+        self.checkpoint = Checkpoint.load(f'{self.output_path}.resume')
+        self.versions = versions
+
+        for stream, version in enumerate(versions[:self.options.streams]):
+            entry = self.checkpoint.get(stream, version)
+            if entry is not None and not self.__can_resume(entry):
+                log.warning('[Handshake] Restarting stream %s, its partial output is missing', stream)
+            elif entry is not None:
+                log.info('[Handshake] Resuming stream %s from segment %s', stream, entry['seq_num'])
+                self.options.resume[stream] = entry['seq_num']
+
+    def __can_resume(self, entry: dict) -> bool:
+        if entry['manifest']:
+            manifest = Manifest.from_bytes(bytearray.fromhex(entry['header']))
+            return DirectoryWriter.can_resume(entry['path'], manifest, entry['size'])
+
+        return FileWriter.can_resume(entry['path'], entry['size'])
+
+    def __send_signatures(self):
+        # Only the old copy of a single file can be used, and a resumed
+        # transfer already has most of the new one
+        if not self.delta or self.options.streams != 1 or self.options.resume or not os.path.isfile(self.output_path):
+            return
+
+        self.signatures = Signatures.from_file(self.output_path)
+        self.options.signatures = self.signatures.get_bytes()
+        log.info(
+            '[Handshake] Sending %s block signatures of %s',
+            len(self.signatures.signatures), self.output_path
+        )
 
     def __receive_data(self):
-        data = b''
-        seq_num = 0
-        while True:
-            try:
-                self.connection.socket.settimeout(BLOCKING)
-                message = self.connection.listen()
-
-                ip = message.ip
-                port = message.port
-                segment = message.segment
-
-                if segment == Segment.fin():
-                    print(f'[!] Received FIN request from {ip}:{port}')
-
-                    fin_ack_message = MessageInfo(
-                        ip=self.connection.ip,
-                        port=self.connection.port,
-                        segment=Segment.fin_ack()
-                    )
-
-                    self.connection.send(self.server_ip, self.server_port, fin_ack_message)
-
-                    print(f'[!] Sending FIN ACK response to {self.server_ip}:{self.server_port}')
-
-                    break
-
-                if segment.seq_num == seq_num:
-                    if segment.seq_num == 0:
-                        file_name, file_ext = struct.unpack("256s4s", segment.payload)
-                        decoded_file_name = file_name.decode().rstrip("\x00")
-                        decoded_file_ext = file_ext.decode().rstrip("\x00")
-                        print(f'[!] Received file metadata with filename: {decoded_file_name} and extension: {decoded_file_ext}')
-                    else:
-                        data += segment.payload
-                    print(f'[!] Received segment number {seq_num}')
-
-                    ack_message = MessageInfo(
-                        ip=self.connection.ip,
-                        port=self.connection.port,
-                        segment=Segment.ack(seq_num, seq_num)
-                    )
-
-                    print(f'[!] Sending ACK response {seq_num} to {self.server_ip}:{self.server_port}')
-                    self.connection.send(self.server_ip, self.server_port, ack_message)
-                    seq_num += 1
-
-                elif segment.seq_num < seq_num:
-                    ack_message = MessageInfo(
-                        ip=self.connection.ip,
-                        port=self.connection.port,
-                        segment=Segment.ack(segment.seq_num, segment.seq_num)
-                    )
-
-                    print(f'[!] Resending ACK response {segment.seq_num} to {self.server_ip}:{self.server_port}')
-                    self.connection.send(self.server_ip, self.server_port, ack_message)
-
-                else:
-                    print(f'[X] Rejected segment number {segment.seq_num}')
-
-            except InvalidChecksumError as e:
-                print(f'[X] Checksum error: {e}')
+        metrics = self.connection.metrics.get(self.server_ip, self.server_port)
+        metrics.track(rtt=self.connection.rtt)
+        metrics.start()
+
+        streams = self.options.streams
+        codec = get_codec(self.options.compression)
+        if codec is not None:
+            log.info('Decompressing with %s', codec.name)
+        reorder_buffers = [create_reorder_buffer(self.options.mode) for _ in range(streams)]
+        writers: list[Union[FileWriter, DirectoryWriter, None]] = [None] * streams
+        headers: list[Optional[bytearray]] = [None] * streams
+        manifests = [False] * streams
+        deltas = [False] * streams
+
+        # The next segment and the bytes written before it, stored together
+        # after every delivered payload so an interrupt never checkpoints one
+        # without the other
+        positions = [(0, 0)] * streams
+
+        # A single stream is written to the output path, several streams
+        # are saved under their own names in the output directory
+        if streams > 1:
+            os.makedirs(self.output_path, exist_ok=True)
+
+        for stream, seq_num in self.options.resume.items():
+            entry = self.checkpoint.streams[stream]
+            headers[stream] = bytearray.fromhex(entry['header'])
+            manifests[stream] = entry['manifest']
+            writers[stream] = self.__open_writer(entry['path'], headers[stream], manifests[stream], entry['size'])
+            reorder_buffers[stream].expected = seq_num
+            positions[stream] = (seq_num, entry['size'])
+
+        unsaved = 0
+        try:
+            while True:
+                try:
+                    self.connection.socket.settimeout(BLOCKING)
+                    message = self.connection.listen()
+
+                    ip = message.ip
+                    port = message.port
+                    segment = message.segment
+
+                    if segment.is_fin():
+                        log.info('Received FIN request from %s:%s', ip, port)
+
+                        fin_ack_message = MessageInfo(
+                            ip=self.connection.ip,
+                            port=self.connection.port,
+                            segment=Segment.fin_ack()
+                        )
+
+                        self.connection.send(self.server_ip, self.server_port, fin_ack_message)
+
+                        log.info('Sending FIN ACK response to %s:%s', self.server_ip, self.server_port)
+
+                        break
+
+                    if not segment.is_data() or segment.stream >= streams:
+                        log.warning('Unknown segment received')
+                        self.connection.release(message)
+                        continue
+
+                    stream = segment.stream
+                    reorder_buffer = reorder_buffers[stream]
+
+                    # A directory stream starts with its manifest instead of
+                    # the file metadata, seq 0 is always delivered on arrival
+                    if segment.is_manifest() and segment.seq_num == 0 and reorder_buffer.expected == 0:
+                        manifests[stream] = True
+                    if segment.is_delta() and segment.seq_num == 0 and reorder_buffer.expected == 0:
+                        deltas[stream] = True
+
+                    if reorder_buffer.accepts(segment.seq_num):
+                        payload = segment.payload
+                        if segment.is_compressed() and segment.seq_num not in reorder_buffer.segments:
+                            payload = codec.decompress(payload)
+
+                        for seq_num, payload in reorder_buffer.push(segment.seq_num, payload):
+                            if writers[stream] is not None:
+                                writers[stream].write(payload)
+                                metrics.deliver(len(payload))
+                                unsaved += len(payload)
+
+                            elif manifests[stream]:
+                                headers[stream] = (headers[stream] or bytearray()) + payload
+                                length = Manifest.get_length(headers[stream])
+                                if length is not None and len(headers[stream]) >= length:
+                                    manifest = Manifest.from_bytes(headers[stream])
+                                    log.info(
+                                        'Received manifest of %s with %s files and %s bytes',
+                                        manifest.name, len(manifest.entries), manifest.size
+                                    )
+
+                                    path = self.__get_stream_path(manifest.name, stream, writers)
+                                    writers[stream] = self.__open_writer(path, headers[stream], True)
+
+                            else:
+                                headers[stream] = bytearray(payload)
+                                file_name, file_ext = struct.unpack("256s4s", payload)
+                                decoded_file_name = file_name.decode().rstrip("\x00")
+                                decoded_file_ext = file_ext.decode().rstrip("\x00")
+                                log.info('Received file metadata with filename: %s and extension: %s', decoded_file_name, decoded_file_ext)
+
+                                name = f'{decoded_file_name}.{decoded_file_ext}' if decoded_file_ext else decoded_file_name
+                                path = self.__get_stream_path(name, stream, writers)
+                                if deltas[stream]:
+                                    log.info('Rebuilding %s from the difference to its old copy', path)
+                                    writers[stream] = DeltaWriter(path, self.output_path, self.signatures.block_size)
+                                else:
+                                    writers[stream] = self.__open_writer(path, headers[stream], False)
+
+                            positions[stream] = (seq_num + 1, writers[stream].size if writers[stream] is not None else 0)
+                            log.debug('Received segment number %s on stream %s', seq_num, stream)
+
+                    elif segment.seq_num >= reorder_buffer.expected:
+                        log.debug('Rejected segment number %s on stream %s', segment.seq_num, stream)
+
+                    ack_num = reorder_buffer.get_ack_num(segment.seq_num)
+                    if ack_num is not None:
+                        ack_message = MessageInfo(
+                            ip=self.connection.ip,
+                            port=self.connection.port,
+                            segment=Segment.ack(ack_num, ack_num, stream)
+                        )
+
+                        log.debug('Sending ACK response %s on stream %s to %s:%s', ack_num, stream, self.server_ip, self.server_port)
+                        self.connection.send(self.server_ip, self.server_port, ack_message)
+
+                    # Delivered payloads are on disk and held ones were copied
+                    self.connection.release(message)
+
+                    if unsaved >= CHECKPOINT_SIZE:
+                        self.__save_checkpoint(writers, positions, headers, manifests)
+                        unsaved = 0
+
+                except InvalidChecksumError as e:
+                    log.warning('Checksum error: %s', e)
+
+            for writer in writers:
+                if writer is not None:
+                    writer.commit()
+                    log.info('Saved %s bytes to %s', writer.size, writer.path)
+
+        except BaseException:
+            # Whatever stops the transfer, what is on disk so far is kept for
+            # the next run to resume from
+            self.__save_checkpoint(writers, positions, headers, manifests)
+            for writer in writers:
+                if writer is not None:
+                    writer.close()
+
+            log.info('Transfer interrupted, checkpoint saved to %s', self.checkpoint.path)
+            raise
+
+        self.checkpoint.remove()
+        self.connection.close()
+
+    def __open_writer(self, path: str, header: bytes, manifest: bool, offset: int = 0):
+        if manifest:
+            return DirectoryWriter(path, Manifest.from_bytes(header), offset=offset)
+
+        return FileWriter(path, offset=offset)
+
+    def __save_checkpoint(self, writers: list, positions: list[tuple[int, int]], headers: list, manifests: list[bool]):
+        if all(writer is None for writer in writers):
+            return
+
+        for stream, writer in enumerate(writers):
+            # A delta only applies to the old copy, it is never resumed
+            if writer is None or stream >= len(self.versions) or isinstance(writer, DeltaWriter):
+                continue
+
+            seq_num, size = positions[stream]
+            writer.sync()
+            self.checkpoint.update(
+                stream, self.versions[stream], seq_num, size, writer.path, headers[stream], manifests[stream]
+            )
+
+        self.checkpoint.save()
+
+    def __get_stream_path(self, name: str, stream: int, writers: list) -> str:
+        if self.options.streams == 1:
+            return self.output_path
+
+        # Names come from the network, none of them may leave the output
+        # directory
+        name = os.path.basename(name.replace('\\', '/'))
+        if name in ['', '.', '..']:
+            raise ValueError(f'Unsafe name on stream {stream}: {name!r}')
 
-        with open(self.output_path, 'wb') as f:
-            f.write(data)
+        path = os.path.join(self.output_path, name)
 
-        self.connection.socket.close()
+        # Two streams with the same name must not overwrite each other
+        if any(writer is not None and writer.path == path for writer in writers):
+            base, ext = os.path.splitext(name)
+            path = os.path.join(self.output_path, f'{base}-{stream}{ext}')
+
+        return path
 
 
 def main():
-    client_port = int(sys.argv[1])
-    broadcast_port = int(sys.argv[2])
-    output_path = sys.argv[3]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('client_port', type=int)
+    parser.add_argument('broadcast_port', type=int)
+    parser.add_argument('output_path')
+    parser.add_argument('--group', type=parse_address, default=None)
+    parser.add_argument('--offload', action='store_true')
+    parser.add_argument('--delta', action='store_true')
+    parser.add_argument('--metrics', default=None)
+    parser.add_argument('--log-level', choices=LEVELS.keys(), default=LOG_LEVEL)
+    parser.add_argument('--log-rate', type=float, default=LOG_RATE_LIMIT)
+    args = parser.parse_args()
+
+    setup_logging(args.log_level, args.log_rate)
 
     client = Client(
         server_ip="localhost",
-        server_port=broadcast_port,
-        output_path=output_path,
+        server_port=args.broadcast_port,
+        output_path=args.output_path,
         ip="localhost",
-        port=client_port
+        port=args.client_port,
+        group=args.group,
+        offload=args.offload,
+        delta=args.delta,
+        metrics_path=args.metrics
     )
 
     client.run()
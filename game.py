@@ -1,11 +1,24 @@
-import sys
+import argparse
+import time
+from collections import deque
 from dataclasses import dataclass
-from math import ceil
+from typing import Optional
 
+from lib.congestion import CONGESTION_CONTROLS, create_congestion_control
 from lib.connection import Node, MessageInfo, Connection
-from lib.constant import TIMEOUT, PAYLOAD_SIZE, WINDOW_SIZE, MSG_FLAG, BLOCKING
+from lib.constant import TIMEOUT, BLOCKING, GO_BACK_N, \
+    MAX_WINDOW_SIZE, LOG_LEVEL, LOG_RATE_LIMIT, FIN_RETRIES, LINGER_TIMEOUT
 from lib.exception import InvalidChecksumError
-from lib.segment import Segment, SegmentFlag
+from lib.log import LEVELS, get_logger, setup_logging
+from lib.metrics import ConnectionMetrics
+from lib.options import HandshakeOptions, PROTOCOLS
+from lib.receiver import ReorderBuffer, create_reorder_buffer
+from lib.segment import Segment
+from lib.sender import create_sender
+from lib.source import FileSource
+from lib.writer import FileWriter
+
+log = get_logger(__name__)
 
 
 @dataclass
@@ -18,8 +31,16 @@ class Game(Node):
     remote_port: int
     output_path: str
 
-    user_data: bytes
-    remote_data: bytes
+    source: FileSource
+
+    send_options: HandshakeOptions
+    receive_options: HandshakeOptions
+    congestion: str
+    max_window: int
+    duplex: bool
+    pending_acks: deque[int]
+    syn_message: Optional[MessageInfo]
+    metrics_path: Optional[str]
 
     def __init__(
             self,
@@ -29,6 +50,12 @@ class Game(Node):
             output_path: str,
             user_ip: str = "localhost",
             remote_ip: str = "localhost",
+            protocol: int = GO_BACK_N,
+            congestion: str = 'reno',
+            max_window: int = MAX_WINDOW_SIZE,
+            offload: bool = False,
+            duplex: bool = False,
+            metrics_path: Optional[str] = None
     ):
         self.user_ip = user_ip
         self.user_port = user_port
@@ -37,79 +64,115 @@ class Game(Node):
         self.input_path = input_path
         self.output_path = output_path
 
-        self.remote_data = b''
+        self.send_options = HandshakeOptions(mode=protocol, duplex=protocol if duplex else None)
+        self.receive_options = HandshakeOptions()
+        self.congestion = congestion
+        self.max_window = max_window
+        self.duplex = duplex
+        self.pending_acks = deque()
+        self.syn_message = None
+        self.metrics_path = metrics_path
 
         self.connection = Connection(ip=self.user_ip, port=self.user_port)
+        if offload:
+            self.__enable_offload()
 
-        with open(input_path, 'rb') as f:
-            self.user_data = f.read()
+        self.source = FileSource(input_path)
+
+    def __enable_offload(self):
+        if self.connection.enable_offload():
+            log.info('UDP offload | gso %s | gro %s', self.connection.gso, self.connection.gro)
+        else:
+            log.warning('UDP offload is not supported, sending one segment per syscall')
 
     def run(self):
-        print(f'[!] Initiating request to {self.remote_ip}:{self.remote_port}...')
+        self.connection.metrics.install_signal_handler(self.metrics_path)
+
+        log.info('Initiating request to %s:%s...', self.remote_ip, self.remote_port)
 
         is_receiver = self.__check_receiver()
 
         if is_receiver:
             self.__three_way_handshake_receiver()
-            self.__listen_data()
-            self.__three_way_handshake_sender()
-            self.__send_data()
+            if self.duplex:
+                self.__exchange_data()
+            else:
+                self.__listen_data()
+                self.__three_way_handshake_sender()
+                self.__send_data()
         else:
             self.__three_way_handshake_sender()
-            self.__send_data()
-            self.__three_way_handshake_receiver()
-            self.__listen_data()
+            if self.duplex:
+                self.__exchange_data()
+            else:
+                self.__send_data()
+                self.__three_way_handshake_receiver()
+                self.__listen_data()
 
+        self.connection.metrics.dump(self.metrics_path)
+        self.source.close()
         self.connection.socket.close()
 
     def __three_way_handshake_sender(self):
-        print(f'[!] Peer now acting as sender')
+        log.info('Peer now acting as sender')
         self.__send_syn()
+        sent_at = time.monotonic()
 
         finished = self.__listen_syn_ack()
         while not finished:
+            self.connection.rtt.backoff()
             self.__send_syn()
+            sent_at = None
             finished = self.__listen_syn_ack()
 
+        self.__sample_rtt(sent_at)
         self.__send_ack()
 
     def __three_way_handshake_receiver(self):
-        print(f'[!] Peer now acting as receiver')
+        log.info('Peer now acting as receiver')
 
         finished = self.__listen_syn()
         while not finished:
             finished = self.__listen_syn()
 
         self.__send_syn_ack()
+        sent_at = time.monotonic()
 
         finished = self.__listen_ack()
         while not finished:
+            self.connection.rtt.backoff()
             self.__send_syn_ack()
+            sent_at = None
             finished = self.__listen_ack()
 
+        self.__sample_rtt(sent_at)
+
+    def __sample_rtt(self, sent_at: Optional[float]):
+        # Karn's rule: a reply to a retransmitted request is not timed
+        if sent_at is not None:
+            self.connection.rtt.sample(time.monotonic() - sent_at)
+
     def __send_syn(self):
         syn_message = MessageInfo(
             ip=self.connection.ip,
             port=self.connection.port,
-            segment=Segment.syn(0)
+            segment=Segment.syn(0, self.send_options.get_bytes())
         )
 
         self.connection.send(self.remote_ip, self.remote_port, syn_message)
 
-        print()
-        print(f'[!] [Handshake] Sending SYN request to {self.remote_ip}:{self.remote_port}')
+        log.info('[Handshake] Sending SYN request to %s:%s', self.remote_ip, self.remote_port)
 
     def __send_syn_ack(self):
         syn_ack_message = MessageInfo(
             ip=self.connection.ip,
             port=self.connection.port,
-            segment=Segment.syn_ack()
+            segment=Segment.syn_ack(self.receive_options.get_bytes())
         )
 
         self.connection.send(self.remote_ip, self.remote_port, syn_ack_message)
 
-        print()
-        print(f'[!] [Handshake] Sending SYN ACK request to {self.remote_ip}:{self.remote_port}')
+        log.info('[Handshake] Sending SYN ACK request to %s:%s', self.remote_ip, self.remote_port)
 
     def __send_ack(self):
         ack_message = MessageInfo(
@@ -120,8 +183,7 @@ class Game(Node):
 
         self.connection.send(self.remote_ip, self.remote_port, ack_message)
 
-        print()
-        print(f'[!] [Handshake] Sending ACK request to {self.remote_ip}:{self.remote_port}')
+        log.info('[Handshake] Sending ACK request to %s:%s', self.remote_ip, self.remote_port)
 
     def __send_fin(self):
         fin_message = MessageInfo(
@@ -132,254 +194,494 @@ class Game(Node):
 
         self.connection.send(self.remote_ip, self.remote_port, fin_message)
 
-        print()
-        print(f'[!] [Final] Sending FIN response to {self.remote_ip}:{self.remote_port}')
+        log.info('[Final] Sending FIN response to %s:%s', self.remote_ip, self.remote_port)
 
-    def __send_fin_ack(self):
+    def __send_fin_ack(self, done: bool = False):
         fin_ack_message = MessageInfo(
             ip=self.connection.ip,
             port=self.connection.port,
-            segment=Segment.fin_ack()
+            segment=Segment.fin_ack(done)
         )
 
         self.connection.send(self.remote_ip, self.remote_port, fin_ack_message)
 
-        print()
-        print(f'[!] [Final] Sending FIN ACK response to {self.remote_ip}:{self.remote_port}')
+        log.info('[Final] Sending FIN ACK response to %s:%s', self.remote_ip, self.remote_port)
 
     def __check_receiver(self):
         try:
             self.connection.socket.settimeout(TIMEOUT)
-            syn_message = self.connection.listen()
+
+            # Keep the request for the handshake instead of waiting for the
+            # remote peer to retransmit it
+            self.syn_message = self.connection.listen()
 
             return True
 
         except TimeoutError as e:
-            print(f'[X] [Handshake] Timeout error: {e}')
+            log.warning('[Handshake] Timeout error: %s', e)
 
             return False
 
         except InvalidChecksumError as e:
-            print(f'[X] [Handshake] Checksum error: {e}')
+            log.warning('[Handshake] Checksum error: %s', e)
 
             return False
 
     def __listen_syn(self) -> bool:
         try:
-            self.connection.socket.settimeout(TIMEOUT)
-            syn_message = self.connection.listen()
+            syn_message = self.syn_message
+            self.syn_message = None
+
+            if syn_message is None:
+                self.connection.socket.settimeout(TIMEOUT)
+                syn_message = self.connection.listen()
 
             ip = syn_message.ip
             port = syn_message.port
             segment = syn_message.segment
 
-            if segment == Segment.syn(0):
-                print(f'[!] [Handshake] Received SYN response from {ip}:{port}')
+            if segment.is_syn():
+                log.info('[Handshake] Received SYN response from %s:%s', ip, port)
+                options = HandshakeOptions.from_bytes(segment.payload)
+                self.receive_options = options.accept()
+
+                if self.duplex and options.duplex is not None:
+                    # Answer with the mode of our own direction, the remote
+                    # accepts it exactly like we accepted theirs
+                    self.receive_options.duplex = self.send_options.mode
+                    self.send_options = HandshakeOptions(mode=self.send_options.mode).accept()
+                    log.info('[Handshake] Using full-duplex exchange with %s:%s', ip, port)
+                else:
+                    self.duplex = False
+
                 return True
 
             else:
-                print(f'[X] [Handshake] Unknown segment received')
+                log.warning('[Handshake] Unknown segment received')
                 return False
 
         except TimeoutError as e:
-            print(f'[X] [Handshake] Timeout error: {e}')
+            log.warning('[Handshake] Timeout error: %s', e)
             return False
 
         except InvalidChecksumError as e:
-            print(f'[X] [Handshake] Checksum error: {e}')
+            log.warning('[Handshake] Checksum error: %s', e)
             return False
 
     def __listen_syn_ack(self) -> True:
         try:
-            print(f'[!] [Handshake] Waiting for response...')
-            self.connection.socket.settimeout(TIMEOUT)
+            log.info('[Handshake] Waiting for response...')
+            self.connection.socket.settimeout(self.connection.rtt.rto)
             syn_ack_message = self.connection.listen()
 
             ip = syn_ack_message.ip
             port = syn_ack_message.port
             segment = syn_ack_message.segment
 
-            if segment == Segment.syn_ack():
-                print(f'[!] [Handshake] Received SYN ACK response from {ip}:{port}')
+            if segment.is_syn_ack():
+                log.info('[Handshake] Received SYN ACK response from %s:%s', ip, port)
+                self.send_options = HandshakeOptions.from_bytes(segment.payload)
+
+                if self.duplex and self.send_options.duplex is not None:
+                    self.receive_options = HandshakeOptions(mode=self.send_options.duplex).accept()
+                    log.info('[Handshake] Using full-duplex exchange with %s:%s', ip, port)
+                else:
+                    self.duplex = False
+
                 return True
 
             else:
-                print(f'[!] [Handshake] Unknown segment received')
+                log.info('[Handshake] Unknown segment received')
                 return False
 
         except TimeoutError as e:
-            print(f'[X] [Handshake] Timeout error: {e}')
+            log.warning('[Handshake] Timeout error: %s', e)
             return False
 
         except InvalidChecksumError as e:
-            print(f'[X] [Handshake] Checksum error: {e}')
+            log.warning('[Handshake] Checksum error: %s', e)
             return False
 
     def __listen_ack(self) -> True:
         try:
-            print(f'[!] [Handshake] Waiting for response...')
+            log.info('[Handshake] Waiting for response...')
 
-            self.connection.socket.settimeout(TIMEOUT)
+            self.connection.socket.settimeout(self.connection.rtt.rto)
             ack_message = self.connection.listen()
 
             ip = ack_message.ip
             port = ack_message.port
             segment = ack_message.segment
 
-            if segment == Segment.ack(0, 0):
-                print(f'[!] [Handshake] Received ACK response from {ip}:{port}')
+            if segment.is_ack() and segment.ack_num == 0:
+                log.info('[Handshake] Received ACK response from %s:%s', ip, port)
                 return True
 
             else:
-                print(f'[!] [Handshake] Unknown segment received')
+                log.info('[Handshake] Unknown segment received')
                 return False
 
         except TimeoutError as e:
-            print(f'[X] [Handshake] Timeout error: {e}')
+            log.warning('[Handshake] Timeout error: %s', e)
             return False
 
         except InvalidChecksumError as e:
-            print(f'[X] [Handshake] Checksum error: {e}')
+            log.warning('[Handshake] Checksum error: %s', e)
             return False
 
     def __send_data(self):
-        client_ip = self.remote_ip
-        client_port = self.remote_port
+        total_segment = self.source.total_segment
+
+        log.info('Total segment: %s', total_segment)
+
+        # Never keep more segments in flight than the receiver can buffer
+        max_window = self.max_window
+        if self.send_options.window:
+            max_window = min(max_window, self.send_options.window)
+
+        sender = create_sender(
+            self.send_options.mode,
+            connection=self.connection,
+            ip=self.remote_ip,
+            port=self.remote_port,
+            total_segment=total_segment,
+            get_segment=self.__get_segment,
+            rtt=self.connection.rtt,
+            congestion=create_congestion_control(self.congestion, max_window)
+        )
 
-        total_segment = ceil(len(self.user_data) / PAYLOAD_SIZE)
-        window_size = min(total_segment, WINDOW_SIZE)
+        sender.send_window()
+        while not sender.is_done():
+            now = time.monotonic()
+            deadline = sender.deadline
 
-        print(f'[!] Total segment: {total_segment}')
+            if deadline is not None and deadline <= now:
+                sender.handle_timeout()
+                sender.send_window()
+                continue
 
-        seq_base = 0
+            try:
+                self.connection.socket.settimeout(BLOCKING if deadline is None else deadline - now)
+                ack_message = self.connection.listen()
 
-        on_transfer = 0
-        while seq_base < total_segment:
+                segment = ack_message.segment
 
-            while on_transfer < window_size:
-                payload = self.user_data[
-                          (seq_base + on_transfer) * PAYLOAD_SIZE:(seq_base + on_transfer + 1) * PAYLOAD_SIZE]
+                if segment.is_syn_ack():
+                    # The remote peer did not get our handshake ACK yet
+                    self.__send_ack()
+                elif segment.is_ack():
+                    sender.handle_ack(segment.ack_num)
+                    self.source.release(sender.seq_base)
+                    sender.send_window()
 
-                segment = Segment(
-                    flags=SegmentFlag(MSG_FLAG),
-                    seq_num=seq_base + on_transfer,
-                    ack_num=seq_base,
-                    checksum=b'',
-                    payload=payload
-                )
+                self.connection.release(ack_message)
 
-                segment.update_checksum()
+            except TimeoutError:
+                continue
 
-                message_info = MessageInfo(
-                    ip=self.connection.ip,
-                    port=self.connection.port,
-                    segment=segment
-                )
+            except InvalidChecksumError as e:
+                log.warning('Checksum error: %s', e)
 
-                self.connection.send(client_ip, client_port, message_info)
-                print(f'[!] Sending segment {seq_base + on_transfer} to {client_ip}:{client_port}')
+        log.info('RTT to %s:%s | %s', self.remote_ip, self.remote_port, self.connection.rtt)
+        log.info('Window to %s:%s | %s', self.remote_ip, self.remote_port, sender.congestion)
+        self.__send_fin()
 
-                on_transfer += 1
+    def __get_segment(self, seq_num: int) -> Segment:
+        payload = self.source.get_payload(seq_num)
 
-            self.connection.socket.settimeout(TIMEOUT)
+        return Segment.data(seq_num, payload)
+
+    def __listen_data(self):
+        metrics = self.connection.metrics.get(self.remote_ip, self.remote_port)
+        metrics.track(rtt=self.connection.rtt)
+        metrics.start()
+
+        with FileWriter(self.output_path) as writer:
+            reorder_buffer = create_reorder_buffer(self.receive_options.mode)
             while True:
                 try:
-                    ack_message = self.connection.listen()
+                    self.connection.socket.settimeout(BLOCKING)
+                    message = self.connection.listen()
 
-                    ack_num = ack_message.segment.ack_num
+                    ip = message.ip
+                    port = message.port
+                    segment = message.segment
 
-                    print(f'[!] Received ACK response {ack_num} from {client_ip}:{client_port}')
+                    if segment.is_fin():
+                        log.info('Received FIN request from %s:%s', ip, port)
 
-                    if ack_num == seq_base:
-                        print(f'[!] ACK received sequentially, sending the next segment')
-                        seq_base += 1
-                        on_transfer -= 1
-                    else:
-                        print(
-                            f'[X] ACK number does not match, retransmit {window_size} segments starting from {seq_base}')
-                        on_transfer = 0
+                        fin_ack_message = MessageInfo(
+                            ip=self.connection.ip,
+                            port=self.connection.port,
+                            segment=Segment.fin_ack()
+                        )
 
-                except TimeoutError as e:
-                    on_transfer = 0
-                    print(f'[X] Timeout error: {e}')
-                    break
+                        self.connection.send(self.remote_ip, self.remote_port, fin_ack_message)
 
-        self.__send_fin()
+                        log.info('Sending FIN ACK response to %s:%s', self.remote_ip, self.remote_port)
 
-    def __listen_data(self):
-        seq_num = 0
-        while True:
-            try:
-                self.connection.socket.settimeout(BLOCKING)
-                message = self.connection.listen()
+                        break
 
-                ip = message.ip
-                port = message.port
-                segment = message.segment
+                    if not segment.is_data():
+                        log.warning('Unknown segment received')
+                        self.connection.release(message)
+                        continue
+
+                    if reorder_buffer.accepts(segment.seq_num):
+                        for seq_num, payload in reorder_buffer.push(segment.seq_num, segment.payload):
+                            writer.write(payload)
+                            metrics.deliver(len(payload))
+                            log.debug('Received segment number %s', seq_num)
+
+                    elif segment.seq_num >= reorder_buffer.expected:
+                        log.debug('Rejected segment number %s', segment.seq_num)
+
+                    ack_num = reorder_buffer.get_ack_num(segment.seq_num)
+                    if ack_num is not None:
+                        ack_message = MessageInfo(
+                            ip=self.connection.ip,
+                            port=self.connection.port,
+                            segment=Segment.ack(ack_num, ack_num)
+                        )
 
-                if segment == Segment.fin():
-                    print(f'[!] Received FIN request from {ip}:{port}')
+                        log.debug('Sending ACK response %s to %s:%s', ack_num, self.remote_ip, self.remote_port)
+                        self.connection.send(self.remote_ip, self.remote_port, ack_message)
 
-                    fin_ack_message = MessageInfo(
-                        ip=self.connection.ip,
-                        port=self.connection.port,
-                        segment=Segment.fin_ack()
-                    )
+                    # Delivered payloads are on disk and held ones were copied
+                    self.connection.release(message)
 
-                    self.connection.send(self.remote_ip, self.remote_port, fin_ack_message)
+                except TimeoutError as e:
+                    log.warning('Timeout error: %s', e)
+
+                except InvalidChecksumError as e:
+                    log.warning('Checksum error: %s', e)
+
+            writer.commit()
+
+        log.info('Saved %s bytes to %s', writer.size, self.output_path)
 
-                    print(f'[!] Sending FIN ACK response to {self.remote_ip}:{self.remote_port}')
+    def __exchange_data(self):
+        log.info('Total segment: %s', self.source.total_segment)
 
-                    break
+        max_window = self.max_window
+        if self.send_options.window:
+            max_window = min(max_window, self.send_options.window)
 
-                if segment.seq_num == seq_num:
-                    self.remote_data += segment.payload
-                    print(f'[!] Received segment number {seq_num}')
+        sender = create_sender(
+            self.send_options.mode,
+            connection=self.connection,
+            ip=self.remote_ip,
+            port=self.remote_port,
+            total_segment=self.source.total_segment,
+            get_segment=self.__get_exchange_segment,
+            rtt=self.connection.rtt,
+            congestion=create_congestion_control(self.congestion, max_window)
+        )
+
+        metrics = self.connection.metrics.get(self.remote_ip, self.remote_port)
+        reorder_buffer = create_reorder_buffer(self.receive_options.mode)
+
+        # Both directions share the socket: our data carries the ACKs for
+        # theirs and the loop only ends once each side has seen the other's FIN
+        fin_deadline = None
+        fin_retries = 0
+        sending = True
+        receiving = True
+        remote_done = False
+
+        with FileWriter(self.output_path) as writer:
+            sender.send_window()
+            self.__flush_acks()
+
+            while sending or receiving:
+                now = time.monotonic()
+
+                if sending and sender.is_done() and fin_deadline is None:
+                    log.info('RTT to %s:%s | %s', self.remote_ip, self.remote_port, self.connection.rtt)
+                    log.info('Window to %s:%s | %s', self.remote_ip, self.remote_port, sender.congestion)
+                    self.__send_fin()
+                    fin_deadline = now + self.connection.rtt.rto
+
+                deadline = fin_deadline if sender.is_done() else sender.deadline
+                if not sending:
+                    deadline = None
+
+                if deadline is not None and deadline <= now:
+                    if not sender.is_done():
+                        sender.handle_timeout()
+                        sender.send_window()
+                        self.__flush_acks()
+                        continue
+
+                    fin_retries += 1
+                    metrics.timeouts += 1
+                    if fin_retries > FIN_RETRIES:
+                        log.warning('[Final] No FIN ACK from %s:%s, giving up', self.remote_ip, self.remote_port)
+                        sending = False
+                        continue
+
+                    log.warning('[Final] Timeout error: no FIN ACK from %s:%s', self.remote_ip, self.remote_port)
+                    self.connection.rtt.backoff()
+                    self.__send_fin()
+                    fin_deadline = now + self.connection.rtt.rto
+                    continue
 
-                    ack_message = MessageInfo(
-                        ip=self.connection.ip,
-                        port=self.connection.port,
-                        segment=Segment.ack(seq_num, seq_num)
-                    )
+                try:
+                    self.connection.socket.settimeout(BLOCKING if deadline is None else deadline - now)
+                    message = self.connection.listen()
 
-                    print(f'[!] Sending ACK response {seq_num} to {self.remote_ip}:{self.remote_port}')
-                    self.connection.send(self.remote_ip, self.remote_port, ack_message)
-                    seq_num += 1
+                except TimeoutError:
+                    continue
 
-                elif segment.seq_num < seq_num:
-                    ack_message = MessageInfo(
-                        ip=self.connection.ip,
-                        port=self.connection.port,
-                        segment=Segment.ack(segment.seq_num, segment.seq_num)
-                    )
+                except InvalidChecksumError as e:
+                    log.warning('Checksum error: %s', e)
+                    continue
 
-                    print(f'[!] Resending ACK response {segment.seq_num} to {self.remote_ip}:{self.remote_port}')
-                    self.connection.send(self.remote_ip, self.remote_port, ack_message)
+                segment = message.segment
 
+                if segment.is_syn():
+                    # The remote peer did not get our SYN ACK yet
+                    self.__send_syn_ack()
+                elif segment.is_syn_ack():
+                    # The remote peer did not get our handshake ACK yet
+                    self.__send_ack()
+                elif segment.is_ack():
+                    sender.handle_ack(segment.ack_num)
+                elif segment.is_data() or segment.is_data_ack():
+                    if segment.is_data_ack():
+                        sender.handle_ack(segment.ack_num)
+
+                    self.__receive_segment(reorder_buffer, writer, metrics, segment)
+                elif segment.is_fin():
+                    log.info('[Final] Received FIN request from %s:%s', message.ip, message.port)
+                    self.__send_fin_ack(done=not sending)
+                    receiving = False
+                elif segment.is_fin_ack() and fin_deadline is not None:
+                    log.info('[Final] Received FIN ACK response from %s:%s', message.ip, message.port)
+                    sending = False
+                    remote_done = segment.ack_num == 1
                 else:
-                    print(f'[X] Rejected segment number {segment.seq_num}')
+                    log.warning('Unknown segment received')
 
-            except TimeoutError as e:
-                print(f'[X] Timeout error: {e}')
+                # Delivered payloads are on disk and held ones were copied
+                self.connection.release(message)
 
-            except InvalidChecksumError as e:
-                print(f'[X] Checksum error: {e}')
+                self.source.release(sender.seq_base)
+                if not sender.is_done():
+                    sender.send_window()
+                self.__flush_acks()
+
+            writer.commit()
+
+        log.info('Saved %s bytes to %s', writer.size, self.output_path)
+
+        # Tell the remote peer we are done so it does not have to wait out
+        # its linger, and wait out ours unless it already said the same
+        self.__send_fin_ack(done=True)
+        if not remote_done:
+            self.__linger()
+
+    def __receive_segment(
+            self,
+            reorder_buffer: ReorderBuffer,
+            writer: FileWriter,
+            metrics: ConnectionMetrics,
+            segment: Segment
+    ):
+        if reorder_buffer.accepts(segment.seq_num):
+            for seq_num, payload in reorder_buffer.push(segment.seq_num, segment.payload):
+                writer.write(payload)
+                metrics.deliver(len(payload))
+                log.debug('Received segment number %s', seq_num)
+
+        elif segment.seq_num >= reorder_buffer.expected:
+            log.debug('Rejected segment number %s', segment.seq_num)
+
+        # Every received segment still produces exactly one ACK, it just
+        # waits to ride on the next data segment going the other way
+        ack_num = reorder_buffer.get_ack_num(segment.seq_num)
+        if ack_num is not None:
+            self.pending_acks.append(ack_num)
+
+    def __get_exchange_segment(self, seq_num: int) -> Segment:
+        payload = self.source.get_payload(seq_num)
+
+        if self.pending_acks:
+            return Segment.data_ack(seq_num, self.pending_acks.popleft(), payload)
+
+        return Segment.data(seq_num, payload)
+
+    def __flush_acks(self):
+        # ACKs that found no data segment to ride on go out on their own
+        while self.pending_acks:
+            ack_num = self.pending_acks.popleft()
+            ack_message = MessageInfo(
+                ip=self.connection.ip,
+                port=self.connection.port,
+                segment=Segment.ack(ack_num, ack_num)
+            )
+
+            log.debug('Sending ACK response %s to %s:%s', ack_num, self.remote_ip, self.remote_port)
+            self.connection.send(self.remote_ip, self.remote_port, ack_message)
+
+    def __linger(self):
+        # Our last FIN ACK may have been lost, keep answering retransmitted
+        # FINs for a few RTOs or until the remote peer is done too
+        deadline = time.monotonic() + min(3 * self.connection.rtt.rto, LINGER_TIMEOUT)
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+
+            try:
+                self.connection.socket.settimeout(deadline - now)
+                message = self.connection.listen()
+
+            except TimeoutError:
+                break
+
+            except InvalidChecksumError:
+                continue
+
+            segment = message.segment
+            self.connection.release(message)
 
-        with open(self.output_path, 'wb') as f:
-            f.write(self.remote_data)
+            if segment.is_fin():
+                self.__send_fin_ack(done=True)
+            elif segment.is_fin_ack() and segment.ack_num == 1:
+                break
 
 
 def main():
-    user_port = int(sys.argv[1])
-    remote_port = int(sys.argv[2])
-    input_path = sys.argv[3]
-    output_path = sys.argv[4]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('user_port', type=int)
+    parser.add_argument('remote_port', type=int)
+    parser.add_argument('input_path')
+    parser.add_argument('output_path')
+    parser.add_argument('--protocol', choices=PROTOCOLS.keys(), default='gbn')
+    parser.add_argument('--congestion', choices=CONGESTION_CONTROLS.keys(), default='reno')
+    parser.add_argument('--max-window', type=int, default=MAX_WINDOW_SIZE)
+    parser.add_argument('--offload', action='store_true')
+    parser.add_argument('--duplex', action='store_true')
+    parser.add_argument('--metrics', default=None)
+    parser.add_argument('--log-level', choices=LEVELS.keys(), default=LOG_LEVEL)
+    parser.add_argument('--log-rate', type=float, default=LOG_RATE_LIMIT)
+    args = parser.parse_args()
+
+    setup_logging(args.log_level, args.log_rate)
 
     peer = Game(
-        user_port=user_port,
-        remote_port=remote_port,
-        input_path=input_path,
-        output_path=output_path
+        user_port=args.user_port,
+        remote_port=args.remote_port,
+        input_path=args.input_path,
+        output_path=args.output_path,
+        protocol=PROTOCOLS[args.protocol],
+        congestion=args.congestion,
+        max_window=args.max_window,
+        offload=args.offload,
+        duplex=args.duplex,
+        metrics_path=args.metrics
     )
 
     peer.run()
@@ -0,0 +1,291 @@
+import time
+from typing import Callable, Optional
+
+from lib.connection import Connection
+from lib.congestion import CongestionControl, Reno
+from lib.constant import NAK_SUPPRESSION, DUP_ACK_THRESHOLD
+from lib.log import get_logger
+from lib.metrics import ConnectionMetrics
+from lib.rtt import RttEstimator
+from lib.segment import Segment
+
+log = get_logger(__name__)
+
+
+class GroupMember:
+    ip: str
+    port: int
+    acked: bytearray
+    seq_base: int
+    next_seq: int
+    selective: bool
+    joined: bool
+    lagging: bool
+    needs_repair: bool
+    dup_acks: int
+    deadline: Optional[float]
+    rtt: RttEstimator
+    sent_at: dict[int, float]
+    sizes: dict[int, int]
+    retransmitted: set[int]
+    metrics: ConnectionMetrics
+
+    def __init__(self, group: "BroadcastGroup", ip: str, port: int, rtt: Optional[RttEstimator] = None):
+        self.group = group
+        self.ip = ip
+        self.port = port
+        self.rtt = rtt if rtt is not None else RttEstimator()
+        self.sent_at = {}
+        self.sizes = {}
+        self.retransmitted = set()
+        self.acked = bytearray(group.total_segment)
+        self.seq_base = 0
+        self.next_seq = 0
+        self.selective = False
+        self.joined = False
+        self.lagging = False
+        self.needs_repair = False
+        self.dup_acks = 0
+        self.deadline = None
+
+        self.metrics = group.connection.metrics.get(ip, port)
+        self.metrics.track(rtt=self.rtt, congestion=group.congestion)
+        self.metrics.start()
+
+    @property
+    def congestion(self) -> CongestionControl:
+        return self.group.congestion
+
+    def is_done(self) -> bool:
+        return self.seq_base >= self.group.total_segment
+
+    def send_window(self):
+        self.joined = True
+        self.group.send_window()
+
+    def record_send(self, seq_num: int, size: int):
+        if seq_num in self.sent_at:
+            self.retransmitted.add(seq_num)
+            self.metrics.retransmissions += 1
+        else:
+            self.sent_at[seq_num] = time.monotonic()
+            self.sizes[seq_num] = size
+
+    def __mark_acked(self, seq_num: int):
+        if not self.acked[seq_num]:
+            self.acked[seq_num] = 1
+            self.metrics.deliver(self.sizes.pop(seq_num, 0))
+
+    def handle_ack(self, ack_num: int):
+        log.debug('Received ACK response %s from %s:%s', ack_num, self.ip, self.port)
+
+        if ack_num >= self.group.total_segment:
+            return
+
+        sent_at = self.sent_at.pop(ack_num, None)
+        if not self.acked[ack_num] and sent_at is not None and ack_num not in self.retransmitted:
+            self.rtt.sample(time.monotonic() - sent_at)
+
+        if self.selective:
+            self.__mark_acked(ack_num)
+        else:
+            # Go-Back-N receivers only ACK segments they accepted in order, so
+            # an ACK covers every segment before it as well
+            for seq_num in range(self.seq_base, ack_num + 1):
+                self.__mark_acked(seq_num)
+
+        if ack_num >= self.seq_base:
+            base = self.seq_base
+            while self.seq_base < self.group.total_segment and self.acked[self.seq_base]:
+                self.seq_base += 1
+
+            if self.seq_base == base:
+                self.__count_duplicate()
+                return
+
+            self.dup_acks = 0
+            self.next_seq = max(self.next_seq, self.seq_base)
+            self.deadline = time.monotonic() + self.rtt.rto if self.seq_base < self.next_seq else None
+
+            if self.lagging and self.group.frontier - self.seq_base <= self.group.window_size:
+                log.info('[Broadcast] %s:%s caught up with the group', self.ip, self.port)
+                self.lagging = False
+
+        elif ack_num == self.seq_base - 1:
+            self.__count_duplicate()
+
+    def __count_duplicate(self):
+        # Duplicate ACKs act as a NAK for the base segment, the repair itself
+        # is batched with other members in the next group round
+        if self.seq_base >= self.next_seq:
+            return
+
+        self.dup_acks += 1
+        self.metrics.duplicate_acks += 1
+        if self.dup_acks == DUP_ACK_THRESHOLD:
+            log.warning('Duplicate ACKs from %s:%s, segment %s is missing', self.ip, self.port, self.seq_base)
+            self.needs_repair = True
+            self.deadline = None
+
+    def handle_timeout(self):
+        log.warning('Timeout error: no ACK from %s:%s for segment %s', self.ip, self.port, self.seq_base)
+
+        if not self.lagging:
+            log.info('[Broadcast] %s:%s is lagging, repairing it separately', self.ip, self.port)
+            self.group.on_loss()
+
+        self.metrics.timeouts += 1
+        self.rtt.backoff()
+        self.lagging = True
+        self.needs_repair = True
+        self.deadline = None
+
+
+class BroadcastGroup:
+    connection: Connection
+    total_segment: int
+    congestion: CongestionControl
+    group: Optional[tuple[str, int]]
+    frontier: int
+    group_base: int
+    recover: int
+    members: list[GroupMember]
+
+    def __init__(
+            self,
+            connection: Connection,
+            total_segment: int,
+            get_segment: Callable[[int], Segment],
+            group: Optional[tuple[str, int]] = None,
+            congestion: Optional[CongestionControl] = None,
+            get_size: Optional[Callable[[int], int]] = None
+    ):
+        self.connection = connection
+        self.total_segment = total_segment
+        self.get_segment = get_segment
+        self.get_size = get_size
+        self.group = group
+        self.congestion = congestion if congestion is not None else Reno()
+
+        self.frontier = 0
+        self.group_base = 0
+        self.recover = 0
+        self.members = []
+
+    @property
+    def window_size(self) -> int:
+        return self.congestion.window
+
+    def on_loss(self):
+        if self.group_base >= self.recover:
+            self.congestion.on_loss()
+            self.recover = self.frontier
+
+    def add_member(self, ip: str, port: int, rtt: Optional[RttEstimator] = None) -> GroupMember:
+        member = GroupMember(self, ip, port, rtt)
+        self.members.append(member)
+
+        return member
+
+    def send_window(self):
+        if not all(member.joined for member in self.members):
+            return
+
+        self.__repair()
+        self.__advance_frontier()
+
+        # Members that fell behind the group get their own window over unicast
+        for member in self.members:
+            window_end = min(member.seq_base + self.window_size, self.frontier)
+            while member.next_seq < window_end:
+                if not member.acked[member.next_seq]:
+                    self.__send_unicast(member, member.next_seq)
+                member.next_seq += 1
+
+            self.__start_timer(member)
+
+    def __advance_frontier(self):
+        healthy = [member for member in self.members if not member.lagging and not member.is_done()]
+        if healthy:
+            group_base = min(member.seq_base for member in healthy)
+        else:
+            group_base = min((member.seq_base for member in self.members), default=self.frontier)
+
+        # The group window grows once per segment every healthy member has
+        rtt = healthy[0].rtt if healthy else RttEstimator()
+        while self.group_base < group_base:
+            self.congestion.on_ack(rtt)
+            self.group_base += 1
+
+        window_end = min(group_base + self.window_size, self.total_segment)
+        while self.frontier < window_end:
+            targets = [member for member in self.members if member.next_seq == self.frontier]
+            self.__send_group(targets, self.frontier)
+
+            for member in targets:
+                member.next_seq += 1
+
+            self.frontier += 1
+
+    def __repair(self):
+        if not any(member.needs_repair for member in self.members):
+            return
+
+        # Members whose timer is about to fire are repaired in the same round,
+        # so a segment missed by several members is resent once per round
+        now = time.monotonic()
+        for member in self.members:
+            if member.deadline is not None and member.deadline - now <= member.rtt.rto * NAK_SUPPRESSION:
+                member.needs_repair = True
+                member.deadline = None
+
+        repairing = [member for member in self.members if member.needs_repair]
+
+        missing = {}
+        for member in repairing:
+            window_end = min(member.seq_base + self.window_size, self.frontier)
+            for seq_num in range(member.seq_base, window_end):
+                if not member.acked[seq_num]:
+                    missing.setdefault(seq_num, []).append(member)
+
+            member.next_seq = window_end
+            member.needs_repair = False
+
+        for seq_num in sorted(missing):
+            log.debug('[Broadcast] Retransmit segment %s to %s client(s)', seq_num, len(missing[seq_num]))
+            self.__send_group(missing[seq_num], seq_num)
+
+    def __send_group(self, targets: list[GroupMember], seq_num: int):
+        if not targets:
+            return
+
+        segment = self.get_segment(seq_num)
+
+        if self.group is not None and len(targets) > 1:
+            self.connection.send_segment(self.group[0], self.group[1], segment)
+            log.debug('Sending segment %s to group %s:%s', seq_num, self.group[0], self.group[1])
+
+            for member in targets:
+                member.record_send(seq_num, self.__get_size(seq_num, segment))
+        else:
+            for member in targets:
+                self.__send_unicast(member, seq_num, segment)
+
+        for member in targets:
+            self.__start_timer(member)
+
+    def __send_unicast(self, member: GroupMember, seq_num: int, segment: Optional[Segment] = None):
+        if segment is None:
+            segment = self.get_segment(seq_num)
+
+        self.connection.send_segment(member.ip, member.port, segment)
+        member.record_send(seq_num, self.__get_size(seq_num, segment))
+        log.debug('Sending segment %s to %s:%s', seq_num, member.ip, member.port)
+
+    def __get_size(self, seq_num: int, segment: Segment) -> int:
+        return self.get_size(seq_num) if self.get_size is not None else len(segment.payload)
+
+    @staticmethod
+    def __start_timer(member: GroupMember):
+        if member.deadline is None and member.seq_base < member.next_seq:
+            member.deadline = time.monotonic() + member.rtt.rto
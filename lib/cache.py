@@ -0,0 +1,65 @@
+from collections import OrderedDict
+
+from lib.constant import CACHE_ENTRY_SIZE
+
+
+class SegmentCache:
+    capacity: int
+    size: int
+    hits: int
+    misses: int
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+
+    def get(self, key):
+        data = self.__entries.get(key)
+        if data is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__entries.move_to_end(key)
+
+        return data
+
+    def put(self, key, data):
+        size = self.__get_size(data)
+        if size > self.capacity:
+            return
+
+        old = self.__entries.pop(key, None)
+        if old is not None:
+            self.size -= self.__get_size(old)
+
+        self.__entries[key] = data
+        self.size += size
+
+        while self.size > self.capacity:
+            _, evicted = self.__entries.popitem(last=False)
+            self.size -= self.__get_size(evicted)
+
+    @staticmethod
+    def __get_size(data) -> int:
+        # Payloads that are views of a mapped file live in the page cache, the
+        # cache only pays for the bytes it keeps alive itself. Every entry
+        # also costs its key, segment and view objects, which dominate for
+        # mapped files
+        payload = getattr(data, 'payload', None)
+        owned = 0 if isinstance(payload, memoryview) else len(data)
+
+        return CACHE_ENTRY_SIZE + owned
+
+    def clear(self):
+        self.__entries.clear()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
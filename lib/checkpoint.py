@@ -0,0 +1,64 @@
+import json
+import os
+from typing import Optional
+
+from lib.log import get_logger
+
+log = get_logger(__name__)
+
+
+class Checkpoint:
+    path: str
+    streams: dict[int, dict]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.streams = {}
+
+    @staticmethod
+    def load(path: str) -> "Checkpoint":
+        checkpoint = Checkpoint(path)
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+
+            checkpoint.streams = {int(stream): entry for stream, entry in data['streams'].items()}
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning('Ignoring unreadable checkpoint %s: %s', path, e)
+
+        return checkpoint
+
+    def get(self, stream: int, version: bytes) -> Optional[dict]:
+        # A checkpoint of another version of the file is of no use
+        entry = self.streams.get(stream)
+        if entry is None or entry['version'] != version.hex():
+            return None
+
+        return entry
+
+    def update(self, stream: int, version: bytes, seq_num: int, size: int, path: str, header: bytes, manifest: bool):
+        self.streams[stream] = {
+            'version': version.hex(),
+            'seq_num': seq_num,
+            'size': size,
+            'path': path,
+            'header': header.hex(),
+            'manifest': manifest
+        }
+
+    def save(self):
+        # The checkpoint is replaced atomically, a crash leaves the old one
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'streams': self.streams}, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,104 @@
+import lzma
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from lib.constant import COMPRESSION_WORKERS
+
+ZLIB = 1
+LZMA = 2
+ZSTD = 3
+
+
+class Codec:
+    id: int
+    name: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+    def __init__(self, id: int, name: str, compress: Callable[[bytes], bytes], decompress: Callable[[bytes], bytes]):
+        self.id = id
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+CODECS = {
+    ZLIB: Codec(ZLIB, 'zlib', lambda data: zlib.compress(data, 6), zlib.decompress),
+    LZMA: Codec(
+        LZMA, 'lzma',
+        lambda data: lzma.compress(data, format=lzma.FORMAT_RAW, filters=[{'id': lzma.FILTER_LZMA2, 'preset': 1}]),
+        lambda data: lzma.decompress(data, format=lzma.FORMAT_RAW, filters=[{'id': lzma.FILTER_LZMA2, 'preset': 1}])
+    )
+}
+
+try:
+    import zstandard
+
+    CODECS[ZSTD] = Codec(
+        ZSTD, 'zstd',
+        lambda data: zstandard.ZstdCompressor(level=3).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data)
+    )
+
+except ImportError:
+    pass
+
+COMPRESSIONS = {codec.name: codec.id for codec in CODECS.values()}
+
+
+def get_codec(ids: list[int]) -> Optional[Codec]:
+    # The first offered codec this side also supports wins
+    return next((CODECS[codec_id] for codec_id in ids if codec_id in CODECS), None)
+
+
+class Compressor:
+    codec: Codec
+
+    def __init__(self, codec: Codec, workers: int = COMPRESSION_WORKERS):
+        self.codec = codec
+
+        # zlib, lzma and zstd release the GIL while they work, so payloads are
+        # compressed ahead of the sender without holding up the send loop
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='compress')
+        self.__pending = {}
+
+    def compress(self, data: bytes) -> Optional[bytes]:
+        compressed = self.codec.compress(data)
+
+        # Nothing is gained from payloads that do not shrink
+        return compressed if len(compressed) < len(data) else None
+
+    def sample(self, payloads: list[bytes]) -> Future:
+        return self.__executor.submit(self.__measure, payloads)
+
+    def __measure(self, payloads: list[bytes]) -> tuple[int, int]:
+        raw_size = 0
+        compressed_size = 0
+        for payload in payloads:
+            compressed = self.compress(payload)
+            raw_size += len(payload)
+            compressed_size += len(compressed) if compressed is not None else len(payload)
+
+        return raw_size, compressed_size
+
+    def prefetch(self, key, data: bytes):
+        if key not in self.__pending:
+            self.__pending[key] = self.__executor.submit(self.compress, data)
+
+    def is_pending(self, key) -> bool:
+        return key in self.__pending
+
+    def get(self, key, data: bytes) -> Optional[bytes]:
+        future: Optional[Future] = self.__pending.pop(key, None)
+        if future is not None:
+            return future.result()
+
+        return self.compress(data)
+
+    def close(self):
+        for future in self.__pending.values():
+            future.cancel()
+
+        self.__pending.clear()
+        self.__executor.shutdown(wait=True)
@@ -0,0 +1,101 @@
+import time
+from abc import ABC, abstractmethod
+
+from lib.constant import WINDOW_SIZE, MAX_WINDOW_SIZE, CUBIC_C, CUBIC_BETA
+from lib.rtt import RttEstimator
+
+
+class CongestionControl(ABC):
+    cwnd: float
+    ssthresh: float
+    max_window: int
+
+    def __init__(self, max_window: int = MAX_WINDOW_SIZE):
+        self.max_window = max_window
+        self.cwnd = min(WINDOW_SIZE, max_window)
+        self.ssthresh = max_window
+
+    @property
+    def window(self) -> int:
+        return max(1, min(int(self.cwnd), self.max_window))
+
+    def on_ack(self, rtt: RttEstimator):
+        if self.cwnd < self.ssthresh:
+            self.cwnd += 1
+        else:
+            self.congestion_avoidance(rtt)
+
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    @abstractmethod
+    def congestion_avoidance(self, rtt: RttEstimator):
+        pass
+
+    @abstractmethod
+    def on_loss(self):
+        pass
+
+    def on_timeout(self):
+        self.on_loss()
+        self.cwnd = 1
+
+    def __str__(self):
+        return f'cwnd {self.cwnd:.1f} | ssthresh {self.ssthresh:.1f}'
+
+
+class Reno(CongestionControl):
+    def congestion_avoidance(self, rtt: RttEstimator):
+        self.cwnd += 1 / self.cwnd
+
+    def on_loss(self):
+        self.ssthresh = max(self.cwnd / 2, 2)
+        self.cwnd = self.ssthresh
+
+
+class Cubic(CongestionControl):
+    w_max: float
+    epoch_start: float
+    k: float
+
+    def __init__(self, max_window: int = MAX_WINDOW_SIZE):
+        super().__init__(max_window)
+
+        self.w_max = self.cwnd
+        self.epoch_start = 0.0
+        self.k = 0.0
+
+    def congestion_avoidance(self, rtt: RttEstimator):
+        now = time.monotonic()
+        if not self.epoch_start:
+            self.epoch_start = now
+            self.w_max = max(self.w_max, self.cwnd)
+            self.k = (self.w_max * (1 - CUBIC_BETA) / CUBIC_C) ** (1 / 3)
+
+        t = now - self.epoch_start
+        target = CUBIC_C * (t - self.k) ** 3 + self.w_max
+
+        # Never grow slower than Reno would over the same time (RFC 8312)
+        srtt = rtt.srtt if rtt.srtt else rtt.rto
+        reno = self.w_max * CUBIC_BETA + 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * t / srtt
+        target = max(target, reno)
+
+        if target > self.cwnd:
+            self.cwnd += (target - self.cwnd) / self.cwnd
+        else:
+            self.cwnd += 0.01 / self.cwnd
+
+    def on_loss(self):
+        self.w_max = self.cwnd
+        self.epoch_start = 0.0
+        self.ssthresh = max(self.cwnd * CUBIC_BETA, 2)
+        self.cwnd = self.ssthresh
+
+
+CONGESTION_CONTROLS = {
+    'reno': Reno,
+    'cubic': Cubic
+}
+
+
+def create_congestion_control(name: str, max_window: int = MAX_WINDOW_SIZE) -> CongestionControl:
+    return CONGESTION_CONTROLS[name](max_window)
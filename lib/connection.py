@@ -1,23 +1,42 @@
+import select
 import struct
+import sys
 from abc import ABC, abstractmethod
+from collections import deque
 from dataclasses import dataclass
+from typing import Optional
 
-from lib.constant import SEGMENT_SIZE
+from lib.checksum import checksum
+from lib.constant import SOCKET_BUFFER_SIZE, SEGMENT_SIZE, GSO_MAX_SEGMENTS, GSO_MAX_SIZE, GRO_BUFFER_SIZE
 from lib.exception import InvalidChecksumError
-from lib.segment import Segment, SegmentFlag
+from lib.log import get_logger
+from lib.metrics import MetricsRegistry
+from lib.pool import BufferPool
+from lib.rtt import RttEstimator
+from lib.segment import Segment, HEADER, HEADER_SIZE
 import socket
 
+log = get_logger(__name__)
+
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+GRO_CMSG_SIZE = socket.CMSG_SPACE(4) if hasattr(socket, 'CMSG_SPACE') else 0
+
 
-@dataclass
 class MessageInfo:
+    __slots__ = ('ip', 'port', 'segment', 'buffer')
+
     ip: str
     port: int
     segment: Segment
+    buffer: Optional[bytearray]
 
-    def __init__(self, ip: str, port: int, segment: Segment):
+    def __init__(self, ip: str, port: int, segment: Segment, buffer: Optional[bytearray] = None):
         self.ip = ip
         self.port = port
         self.segment = segment
+        self.buffer = buffer
 
 
 @dataclass
@@ -25,53 +44,278 @@ class Connection:
     ip: str
     port: int
     socket: socket
+    group_socket: Optional[socket.socket]
+    rtt: RttEstimator
+    pool: BufferPool
+    gso: bool
+    gro: bool
+    metrics: MetricsRegistry
+    send_calls: int
+    receive_calls: int
 
     def __init__(self, ip: str, port: int):
         self.ip = ip
         self.port = port
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
         self.socket.bind((self.ip, self.port))
+        self.group_socket = None
+        self.rtt = RttEstimator()
+        self.pool = BufferPool()
+        self.gso = False
+        self.gro = False
+        self.metrics = MetricsRegistry()
+        self.send_calls = 0
+        self.receive_calls = 0
+        self.__header = bytearray(HEADER_SIZE)
+        self.__headers = memoryview(bytearray(HEADER_SIZE * GSO_MAX_SEGMENTS))
+        self.__pending = deque()
+        self.__references = {}
+
+    def enable_multicast(self):
+        interface = socket.inet_aton(socket.gethostbyname(self.ip))
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, interface)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self.socket.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+
+    def enable_offload(self, segment_size: int = SEGMENT_SIZE) -> bool:
+        # UDP segmentation and receive offload are Linux only, anything else
+        # keeps sending and receiving one datagram per syscall
+        if not sys.platform.startswith('linux') or not hasattr(self.socket, 'sendmsg'):
+            return False
+
+        if 2 * segment_size > GSO_MAX_SIZE:
+            log.warning(
+                'UDP offload has no effect: two %s byte segments do not fit in one %s byte batch',
+                segment_size, GSO_MAX_SIZE
+            )
+
+        try:
+            self.socket.getsockopt(SOL_UDP, UDP_SEGMENT)
+            self.gso = True
+        except OSError:
+            self.gso = False
+
+        try:
+            self.socket.setsockopt(SOL_UDP, UDP_GRO, 1)
+            if self.group_socket is not None:
+                self.group_socket.setsockopt(SOL_UDP, UDP_GRO, 1)
+
+            self.gro = True
+            self.pool = BufferPool(GRO_BUFFER_SIZE)
+        except OSError:
+            self.gro = False
+
+        return self.gso or self.gro
+
+    def join_group(self, group_ip: str, group_port: int):
+        interface = socket.inet_aton(socket.gethostbyname(self.ip))
+        membership = socket.inet_aton(group_ip) + interface
+
+        self.group_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.group_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.group_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        self.group_socket.bind((group_ip, group_port))
+        self.group_socket.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+
+        if self.gro:
+            self.group_socket.setsockopt(SOL_UDP, UDP_GRO, 1)
 
     def send(self, ip: str, port: int, message: MessageInfo):
-        self.socket.sendto(message.segment.get_bytes(), (ip, port))
+        self.send_segment(ip, port, message.segment)
+
+    def send_segment(self, ip: str, port: int, segment: Segment):
+        self.send_calls += 1
+
+        metrics = self.metrics.get(ip, port)
+        metrics.segments_sent += 1
+        metrics.bytes_sent += len(segment)
+
+        if not hasattr(self.socket, 'sendmsg'):
+            self.socket.sendto(segment.get_bytes(), (ip, port))
+            return
+
+        # Header and payload go out as one datagram straight from their own
+        # buffers, the payload is never copied into a joined bytes object
+        segment.pack_header(self.__header)
+        self.socket.sendmsg([self.__header, segment.payload], [], 0, (ip, port))
+
+    def send_segments(self, ip: str, port: int, segments: list[Segment]):
+        start = 0
+        while start < len(segments):
+            end = self.__batch_end(segments, start) if self.gso else start + 1
+
+            if end - start == 1:
+                self.send_segment(ip, port, segments[start])
+            else:
+                self.__send_batch(ip, port, segments[start:end])
+
+            start = end
+
+    @staticmethod
+    def __batch_end(segments: list[Segment], start: int) -> int:
+        # The kernel splits a batch into equal sized datagrams, only the last
+        # one may be shorter and the whole batch has to fit in one datagram
+        size = len(segments[start])
+        total = size
+        end = start + 1
+
+        while end < len(segments) and end - start < GSO_MAX_SEGMENTS:
+            length = len(segments[end])
+            if length > size or total + length > GSO_MAX_SIZE:
+                break
+
+            total += length
+            end += 1
+
+            if length < size:
+                break
+
+        return end
+
+    def __send_batch(self, ip: str, port: int, segments: list[Segment]):
+        buffers = []
+        for index, segment in enumerate(segments):
+            offset = index * HEADER_SIZE
+            segment.pack_header(self.__headers, offset)
+            buffers.append(self.__headers[offset:offset + HEADER_SIZE])
+            buffers.append(segment.payload)
+
+        size = struct.pack('=H', len(segments[0]))
+
+        try:
+            self.socket.sendmsg(buffers, [(SOL_UDP, UDP_SEGMENT, size)], 0, (ip, port))
+            self.send_calls += 1
+
+            metrics = self.metrics.get(ip, port)
+            metrics.segments_sent += len(segments)
+            metrics.bytes_sent += sum(len(segment) for segment in segments)
+
+        except OSError as e:
+            # The route or device cannot segment, fall back for good
+            log.warning('UDP segmentation offload failed: %s', e)
+            self.gso = False
+
+            for segment in segments:
+                self.send_segment(ip, port, segment)
+
+    def __receive_from(self, sock: socket.socket, buffer: bytearray) -> tuple[int, tuple, int]:
+        self.receive_calls += 1
+
+        if not self.gro:
+            size, addr = sock.recvfrom_into(buffer)
+            return size, addr, size
+
+        size, ancdata, _, addr = sock.recvmsg_into([buffer], GRO_CMSG_SIZE)
+
+        # Coalesced datagrams come with the size of each original datagram
+        segment_size = size
+        for level, kind, data in ancdata:
+            if level == SOL_UDP and kind == UDP_GRO:
+                segment_size = int.from_bytes(data[:4], sys.byteorder)
+
+        return size, addr, segment_size
+
+    def __receive(self, buffer: bytearray):
+        if self.group_socket is None:
+            return self.__receive_from(self.socket, buffer)
+
+        # Segments can arrive on the unicast socket or on the multicast group,
+        # wait on both using the timeout configured on the main socket
+        timeout = self.socket.gettimeout()
+        readable, _, _ = select.select([self.socket, self.group_socket], [], [], timeout)
+
+        if not readable:
+            if timeout == 0:
+                raise BlockingIOError()
+            raise TimeoutError('timed out')
+
+        return self.__receive_from(readable[0], buffer)
+
+    def __receive_batch(self):
+        buffer = self.pool.acquire()
+
+        try:
+            size, addr, segment_size = self.__receive(buffer)
+        except OSError:
+            self.pool.release(buffer)
+            raise
+
+        view = memoryview(buffer)[:size]
+        offsets = range(0, size, segment_size) if segment_size else [0]
+
+        self.__references[id(buffer)] = len(offsets)
+        for offset in offsets:
+            self.__pending.append((buffer, view[offset:offset + segment_size], addr))
 
     def listen(self) -> MessageInfo:
+        if not self.__pending:
+            self.__receive_batch()
+
+        buffer, view, addr = self.__pending.popleft()
+
+        metrics = self.metrics.get(addr[0], addr[1])
+        metrics.segments_received += 1
+        metrics.bytes_received += len(view)
+
         try:
-            data, addr = self.socket.recvfrom(SEGMENT_SIZE)
-
-            seq_num = struct.unpack('!I', data[0:4])[0]
-            ack_num = struct.unpack('!I', data[4:8])[0]
-            flags = SegmentFlag(data[8])
-            checksum = data[10:12]
-            payload = data[12:]
-
-            ip = addr[0]
-            port = addr[1]
-
-            segment = Segment(
-                flags=flags,
-                seq_num=seq_num,
-                ack_num=ack_num,
-                checksum=checksum,
-                payload=payload
-            )
+            seq_num, ack_num, flags, stream, crc_num = HEADER.unpack_from(view)
 
-            if not segment.is_valid_checksum():
-                raise InvalidChecksumError(f'[X] Invalid checksum for sequence number {segment.seq_num}')
+            crc = checksum(view[0:10])
+            crc = checksum(b'\x00\x00', crc)
+            crc = checksum(view[HEADER_SIZE:], crc)
 
-            message = MessageInfo(
-                ip=ip,
-                port=port,
-                segment=segment
-            )
+            if crc != crc_num:
+                metrics.checksum_failures += 1
+                raise InvalidChecksumError(f'[X] Invalid checksum for sequence number {seq_num}')
+
+        except (struct.error, InvalidChecksumError):
+            self.__release_buffer(buffer)
+            raise
+
+        # The payload is a view into the pooled buffer, it stays valid until
+        # the consumer hands the message back with release
+        segment = Segment(
+            flags=flags,
+            seq_num=seq_num,
+            ack_num=ack_num,
+            payload=view[HEADER_SIZE:],
+            checksum=crc_num,
+            stream=stream
+        )
+
+        return MessageInfo(
+            ip=addr[0],
+            port=addr[1],
+            segment=segment,
+            buffer=buffer
+        )
 
-            return message
+    def release(self, message: MessageInfo):
+        if message.buffer is not None:
+            self.__release_buffer(message.buffer)
+            message.buffer = None
 
-        except TimeoutError as e:
-            raise e
+    def __release_buffer(self, buffer: bytearray):
+        # A coalesced receive goes back to the pool once every segment that
+        # was split out of it has been released
+        references = self.__references.pop(id(buffer), 1) - 1
+        if references > 0:
+            self.__references[id(buffer)] = references
+        else:
+            self.pool.release(buffer)
 
     def close(self):
         self.socket.close()
+        if self.group_socket is not None:
+            self.group_socket.close()
+
+
+def parse_address(address: str) -> tuple[str, int]:
+    ip, port = address.rsplit(':', 1)
+
+    return ip, int(port)
 
 
 class Node(ABC):
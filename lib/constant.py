@@ -3,8 +3,51 @@ SYN_FLAG = 0b00000010
 ACK_FLAG = 0b00010000
 FIN_FLAG = 0b00000001
 MSG_FLAG = 0b00000000
+MANIFEST_FLAG = 0b00100000
+COMPRESSED_FLAG = 0b01000000
 TIMEOUT = 1
 BLOCKING = None
 SEGMENT_SIZE = 32768
 PAYLOAD_SIZE = 32756
 WINDOW_SIZE = 5
+CRC_POLY = 0x8005
+CACHE_SIZE = 64 * 1024 * 1024
+CACHE_ENTRY_SIZE = 512
+NAK_SUPPRESSION = 0.25
+GO_BACK_N = 0
+SELECTIVE_REPEAT = 1
+MIN_TIMEOUT = 0.2
+MAX_TIMEOUT = 16
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+MAX_WINDOW_SIZE = 64
+REORDER_BUFFER_SIZE = MAX_WINDOW_SIZE
+CUBIC_C = 0.4
+CUBIC_BETA = 0.7
+SOCKET_BUFFER_SIZE = MAX_WINDOW_SIZE * SEGMENT_SIZE
+DUP_ACK_THRESHOLD = 3
+WRITE_BUFFER_SIZE = 1024 * 1024
+RECEIVE_POOL_SIZE = 8
+GSO_MAX_SEGMENTS = 64
+GSO_MAX_SIZE = 65507
+GRO_BUFFER_SIZE = 65535
+LOG_LEVEL = 'info'
+LOG_RATE_LIMIT = 20
+LOG_QUEUE_SIZE = 10000
+REORDER_DELAY = 0.01
+FIN_RETRIES = 8
+LINGER_TIMEOUT = 2 * TIMEOUT
+MAX_STREAMS = 255
+VERSION_SIZE = 8
+CHECKPOINT_SIZE = 4 * 1024 * 1024
+COMPRESSION_WORKERS = 2
+COMPRESSION_AHEAD = 16
+COMPRESSION_SAMPLES = 4
+COMPRESSION_RATIO = 0.9
+COMPRESSION_MISSES = 8
+DELTA_FLAG = 0b10000000
+DELTA_BLOCK_SIZE = 4096
+DELTA_SIGNATURE_SIZE = 24 * 1024
+DELTA_DENSE_LIMIT = 256 * 1024
+DELTA_SKIP_BLOCKS = 15
+DELTA_POLL = 0.01
@@ -0,0 +1,132 @@
+import hashlib
+import os
+import struct
+import zlib
+from math import ceil
+
+from lib.constant import DELTA_BLOCK_SIZE, DELTA_SIGNATURE_SIZE, DELTA_DENSE_LIMIT, DELTA_SKIP_BLOCKS
+
+COPY = b'C'
+LITERAL = b'L'
+COPY_HEADER = struct.Struct('!cII')
+LITERAL_HEADER = struct.Struct('!cI')
+
+BLOCK_SIZE = struct.Struct('!I')
+SIGNATURE = struct.Struct('!I8s')
+ADLER_MOD = 65521
+
+
+def strong_hash(block) -> bytes:
+    return hashlib.blake2b(block, digest_size=8).digest()
+
+
+def roll(weak: int, out_byte: int, in_byte: int, block_size: int) -> int:
+    # Adler-32 of the window moved one byte forward
+    a = (weak & 0xFFFF) - out_byte + in_byte
+    a %= ADLER_MOD
+    b = ((weak >> 16) - block_size * out_byte + a - 1) % ADLER_MOD
+
+    return (b << 16) | a
+
+
+class Signatures:
+    block_size: int
+    signatures: list[tuple[int, bytes]]
+    weak: dict[int, list[int]]
+
+    def __init__(self, block_size: int, signatures: list[tuple[int, bytes]]):
+        self.block_size = block_size
+        self.signatures = signatures
+        self.weak = {}
+        for index, (weak, _) in enumerate(signatures):
+            self.weak.setdefault(weak, []).append(index)
+
+    @staticmethod
+    def from_file(path: str) -> "Signatures":
+        # Blocks grow with the file so every signature fits into the SYN ACK,
+        # a short last block is simply sent again
+        size = os.path.getsize(path)
+        max_blocks = (DELTA_SIGNATURE_SIZE - BLOCK_SIZE.size) // SIGNATURE.size
+        block_size = max(DELTA_BLOCK_SIZE, ceil(size / max_blocks))
+
+        signatures = []
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(block_size)
+                if len(block) < block_size:
+                    break
+
+                signatures.append((zlib.adler32(block), strong_hash(block)))
+
+        return Signatures(block_size, signatures)
+
+    def get_bytes(self) -> bytes:
+        return BLOCK_SIZE.pack(self.block_size) + b''.join(
+            SIGNATURE.pack(weak, strong) for weak, strong in self.signatures
+        )
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Signatures":
+        (block_size,) = BLOCK_SIZE.unpack_from(data)
+        body = data[BLOCK_SIZE.size:]
+
+        return Signatures(block_size, list(SIGNATURE.iter_unpack(body[:len(body) // SIGNATURE.size * SIGNATURE.size])))
+
+    def find(self, block, weak: int):
+        indexes = self.weak.get(weak)
+        if not indexes:
+            return None
+
+        strong = strong_hash(block)
+
+        return next((index for index in indexes if self.signatures[index][1] == strong), None)
+
+
+def compute_delta(data, signatures: Signatures) -> list[tuple[bytes, int, int]]:
+    # rsync's search: roll the weak checksum one byte at a time until a block
+    # of the old file turns up, then jump a whole block. Long runs without a
+    # match only search one block in every few, which bounds the Python work
+    # on rewritten files
+    block_size = signatures.block_size
+    size = len(data)
+    instructions = []
+    literal_start = 0
+    position = 0
+    rolled = 0
+    weak = None
+
+    while position + block_size <= size:
+        if weak is None:
+            weak = zlib.adler32(data[position:position + block_size])
+            rolled = 0
+
+        index = signatures.find(data[position:position + block_size], weak) if weak in signatures.weak else None
+        if index is not None:
+            if literal_start < position:
+                instructions.append((LITERAL, literal_start, position - literal_start))
+
+            last = instructions[-1] if instructions else None
+            if last is not None and last[0] == COPY and last[1] + last[2] == index:
+                instructions[-1] = (COPY, last[1], last[2] + 1)
+            else:
+                instructions.append((COPY, index, 1))
+
+            position += block_size
+            literal_start = position
+            weak = None
+            continue
+
+        rolled += 1
+        if position - literal_start >= DELTA_DENSE_LIMIT and rolled >= block_size:
+            position += 1 + DELTA_SKIP_BLOCKS * block_size
+            weak = None
+            continue
+
+        if position + block_size < size:
+            weak = roll(weak, data[position], data[position + block_size], block_size)
+        position += 1
+
+    if literal_start < size:
+        instructions.append((LITERAL, literal_start, size - literal_start))
+
+    return instructions
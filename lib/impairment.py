@@ -0,0 +1,176 @@
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+from lib.constant import REORDER_DELAY
+
+UNITS = {'K': 1000, 'M': 1000 ** 2, 'G': 1000 ** 3}
+
+
+@dataclass
+class Impairment:
+    loss: float
+    burst_rate: float
+    burst_length: float
+    corrupt: float
+    duplicate: float
+    reorder: float
+    delay: float
+    jitter: float
+    rate: float
+
+    def __init__(
+        self,
+        loss: float = 0.0,
+        burst_rate: float = 0.0,
+        burst_length: float = 1.0,
+        corrupt: float = 0.0,
+        duplicate: float = 0.0,
+        reorder: float = 0.0,
+        delay: float = 0.0,
+        jitter: float = 0.0,
+        rate: float = 0.0
+    ):
+        self.loss = loss
+        self.burst_rate = burst_rate
+        self.burst_length = burst_length
+        self.corrupt = corrupt
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.delay = delay
+        self.jitter = jitter
+        self.rate = rate
+
+    @staticmethod
+    def parse(text: str) -> "Impairment":
+        # loss=0.05,burst=0.01:4,corrupt=0.01,duplicate=0.01,reorder=0.02,
+        # delay=20,jitter=5,rate=1M with delays in milliseconds and the rate
+        # in bytes per second
+        impairment = Impairment()
+
+        for item in text.split(','):
+            if not item.strip():
+                continue
+
+            name, _, value = item.partition('=')
+            name = name.strip()
+            value = value.strip()
+
+            if name in ['loss', 'corrupt', 'duplicate', 'reorder']:
+                setattr(impairment, name, float(value))
+            elif name == 'burst':
+                rate, _, length = value.partition(':')
+                impairment.burst_rate = float(rate)
+                impairment.burst_length = float(length or 1)
+            elif name in ['delay', 'jitter']:
+                setattr(impairment, name, float(value) / 1000)
+            elif name == 'rate':
+                unit = UNITS.get(value[-1:].upper(), 1)
+                impairment.rate = float(value[:-1] if unit > 1 else value) * unit
+            else:
+                raise ValueError(f'Unknown impairment {name}')
+
+        return impairment
+
+
+class Fate:
+    __slots__ = ('index', 'drop', 'corrupt_offset', 'corrupt_mask', 'copies', 'delay', 'reordered')
+
+    index: int
+    drop: bool
+    corrupt_offset: Optional[int]
+    corrupt_mask: int
+    copies: int
+    delay: float
+    reordered: bool
+
+    def __init__(
+        self,
+        index: int,
+        drop: bool = False,
+        corrupt_offset: Optional[int] = None,
+        corrupt_mask: int = 0,
+        copies: int = 1,
+        delay: float = 0.0,
+        reordered: bool = False
+    ):
+        self.index = index
+        self.drop = drop
+        self.corrupt_offset = corrupt_offset
+        self.corrupt_mask = corrupt_mask
+        self.copies = copies
+        self.delay = delay
+        self.reordered = reordered
+
+    def apply(self, data: bytes) -> bytes:
+        if self.corrupt_offset is None or not data:
+            return data
+
+        corrupted = bytearray(data)
+        corrupted[self.corrupt_offset % len(data)] ^= self.corrupt_mask
+
+        return bytes(corrupted)
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in Fate.__slots__}
+
+    @staticmethod
+    def from_dict(data: dict) -> "Fate":
+        return Fate(**{name: data[name] for name in Fate.__slots__ if name in data})
+
+
+class Link:
+    impairment: Impairment
+    index: int
+    bursting: bool
+
+    def __init__(self, impairment: Impairment, seed: str, replay: Optional[dict[int, Fate]] = None):
+        self.impairment = impairment
+        self.index = 0
+        self.bursting = False
+        self.__random = random.Random(seed)
+        self.__replay = replay
+        self.__free_at = 0.0
+
+    def decide(self) -> Fate:
+        index = self.index
+        self.index += 1
+
+        if self.__replay is not None:
+            return self.__replay.get(index, Fate(index))
+
+        # Every packet consumes the same number of draws whatever happens to
+        # it, so the fate of packet n only depends on the seed and n
+        draws = [self.__random.random() for _ in range(8)]
+        impairment = self.impairment
+
+        if self.bursting:
+            self.bursting = draws[0] >= 1 / max(impairment.burst_length, 1)
+        else:
+            self.bursting = draws[0] < impairment.burst_rate
+
+        fate = Fate(index)
+        fate.drop = self.bursting or draws[1] < impairment.loss
+
+        if draws[2] < impairment.corrupt:
+            fate.corrupt_offset = int(draws[3] * 65536)
+            fate.corrupt_mask = 1 + int(draws[4] * 255)
+
+        fate.copies = 2 if draws[5] < impairment.duplicate else 1
+        fate.reordered = draws[6] < impairment.reorder
+        fate.delay = max(0.0, impairment.delay + (2 * draws[7] - 1) * impairment.jitter)
+        if fate.reordered:
+            fate.delay += REORDER_DELAY
+
+        return fate
+
+    def schedule(self, now: float, size: int, delay: float) -> float:
+        # A rate limit serialises packets on the link, each one leaves once
+        # the previous one has been transmitted
+        if self.impairment.rate <= 0:
+            return now + delay
+
+        start = max(now, self.__free_at)
+        self.__free_at = start + size / self.impairment.rate
+
+        return self.__free_at + delay
@@ -0,0 +1,116 @@
+import atexit
+import logging
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from lib.constant import LOG_LEVEL, LOG_RATE_LIMIT, LOG_QUEUE_SIZE
+
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR
+}
+
+
+class RateLimitFilter(logging.Filter):
+    rate: float
+
+    def __init__(self, rate: float = LOG_RATE_LIMIT):
+        super().__init__()
+        self.rate = rate
+        self.__buckets = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0:
+            return True
+
+        # One token bucket per call site, so a flood of one event cannot
+        # drown out the others
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        tokens, updated, suppressed = self.__buckets.get(key, (self.rate, now, 0))
+        tokens = min(self.rate, tokens + (now - updated) * self.rate)
+
+        if tokens < 1:
+            self.__buckets[key] = (tokens, now, suppressed + 1)
+            return False
+
+        record.suppressed = suppressed
+        self.__buckets[key] = (tokens - 1, now, 0)
+
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    dropped: int
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        # Never block the caller on a slow terminal or pipe
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LevelFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        prefix = '[X]' if record.levelno >= logging.WARNING else '[!]'
+        message = f'{prefix} {super().format(record)}'
+
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            message += f' ({suppressed} similar messages suppressed)'
+
+        return message
+
+
+_queue: Optional[queue.Queue] = None
+_listener: Optional[QueueListener] = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(name)
+
+
+def setup_logging(level: str = LOG_LEVEL, rate: float = LOG_RATE_LIMIT, stream=None):
+    global _queue, _listener
+
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    output.setFormatter(LevelFormatter('%(message)s'))
+
+    _queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = DroppingQueueHandler(_queue)
+    handler.addFilter(RateLimitFilter(rate))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LEVELS[level])
+
+    _listener = QueueListener(_queue, output)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def flush_logging():
+    # Wait until everything queued so far is written, e.g. before prompting
+    if _queue is not None:
+        _queue.join()
+
+
+def shutdown_logging():
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
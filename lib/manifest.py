@@ -0,0 +1,92 @@
+import os
+import struct
+from typing import Optional
+
+LENGTH = struct.Struct('!I')
+NAME = struct.Struct('!H')
+ENTRY = struct.Struct('!QH')
+
+
+class Manifest:
+    name: str
+    entries: list[tuple[str, int]]
+
+    def __init__(self, name: str, entries: list[tuple[str, int]]):
+        self.name = name
+        self.entries = entries
+
+    @property
+    def size(self) -> int:
+        return sum(size for _, size in self.entries)
+
+    @staticmethod
+    def from_directory(root: str) -> "Manifest":
+        entries = []
+
+        # Sorted so the same tree always produces the same byte stream
+        for directory, directories, files in os.walk(root):
+            directories.sort()
+            for file_name in sorted(files):
+                path = os.path.join(directory, file_name)
+                if not os.path.isfile(path):
+                    continue
+
+                relative_path = os.path.relpath(path, root).replace(os.sep, '/')
+                entries.append((relative_path, os.path.getsize(path)))
+
+        return Manifest(os.path.basename(os.path.abspath(root)), entries)
+
+    def get_bytes(self) -> bytes:
+        name = self.name.encode()
+        body = [NAME.pack(len(name)), name, LENGTH.pack(len(self.entries))]
+
+        for path, size in self.entries:
+            encoded_path = path.encode()
+            body.append(ENTRY.pack(size, len(encoded_path)))
+            body.append(encoded_path)
+
+        data = b''.join(body)
+
+        # The length prefix tells the receiver when the manifest is complete,
+        # it may span several segments
+        return LENGTH.pack(len(data)) + data
+
+    @staticmethod
+    def get_length(data: bytes) -> Optional[int]:
+        if len(data) < LENGTH.size:
+            return None
+
+        return LENGTH.size + LENGTH.unpack_from(data)[0]
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "Manifest":
+        offset = LENGTH.size
+
+        (name_length,) = NAME.unpack_from(data, offset)
+        offset += NAME.size
+        name = Manifest.__check_path(bytes(data[offset:offset + name_length]).decode())
+        offset += name_length
+
+        (count,) = LENGTH.unpack_from(data, offset)
+        offset += LENGTH.size
+
+        entries = []
+        for _ in range(count):
+            size, path_length = ENTRY.unpack_from(data, offset)
+            offset += ENTRY.size
+            path = bytes(data[offset:offset + path_length]).decode()
+            offset += path_length
+
+            entries.append((Manifest.__check_path(path), size))
+
+        return Manifest(name, entries)
+
+    @staticmethod
+    def __check_path(path: str) -> str:
+        # Paths come from the network, none of them may leave the output
+        # directory
+        parts = path.split('/')
+        if not path or path.startswith('/') or '\\' in path or any(part in ['', '.', '..'] for part in parts):
+            raise ValueError(f'Unsafe path in manifest: {path!r}')
+
+        return path
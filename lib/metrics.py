@@ -0,0 +1,172 @@
+import json
+import signal
+import socket
+import threading
+import time
+from typing import Optional
+
+from lib.log import get_logger
+
+log = get_logger(__name__)
+
+COUNTERS = [
+    'segments_sent',
+    'bytes_sent',
+    'segments_received',
+    'bytes_received',
+    'bytes_delivered',
+    'retransmissions',
+    'timeouts',
+    'checksum_failures',
+    'duplicate_acks'
+]
+
+
+class ConnectionMetrics:
+    peer: str
+    created_at: float
+    started_at: Optional[float]
+    delivered_at: Optional[float]
+    segments_sent: int
+    bytes_sent: int
+    segments_received: int
+    bytes_received: int
+    bytes_delivered: int
+    retransmissions: int
+    timeouts: int
+    checksum_failures: int
+    duplicate_acks: int
+
+    def __init__(self, peer: str):
+        self.peer = peer
+        self.created_at = time.monotonic()
+        self.started_at = None
+        self.delivered_at = None
+        self.segments_sent = 0
+        self.bytes_sent = 0
+        self.segments_received = 0
+        self.bytes_received = 0
+        self.bytes_delivered = 0
+        self.retransmissions = 0
+        self.timeouts = 0
+        self.checksum_failures = 0
+        self.duplicate_acks = 0
+        self.__rtt = None
+        self.__congestion = None
+
+    def start(self):
+        # Goodput is measured from the first data segment, not from the
+        # handshake or the time spent waiting for other clients
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+
+    def deliver(self, size: int):
+        self.bytes_delivered += size
+        self.delivered_at = time.monotonic()
+
+    def track(self, rtt=None, congestion=None):
+        # Gauges are read from the live estimator and controller when a
+        # snapshot is taken, so the hot path never updates them
+        if rtt is not None:
+            self.__rtt = rtt
+        if congestion is not None:
+            self.__congestion = congestion
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        data = {name: getattr(self, name) for name in COUNTERS}
+
+        transfer = 0.0
+        if self.started_at is not None and self.delivered_at is not None:
+            transfer = self.delivered_at - self.started_at
+
+        data['elapsed'] = now - self.created_at
+        data['goodput'] = self.bytes_delivered / transfer if transfer > 0 else 0.0
+        data['window'] = self.__congestion.window if self.__congestion is not None else None
+        data['srtt'] = self.__rtt.srtt if self.__rtt is not None else None
+        data['rto'] = self.__rtt.rto if self.__rtt is not None else None
+
+        return data
+
+
+class MetricsRegistry:
+    connections: dict[tuple[str, int], ConnectionMetrics]
+
+    def __init__(self):
+        self.connections = {}
+        self.__addresses = {}
+        self.__lock = threading.Lock()
+
+    def get(self, ip: str, port: int) -> ConnectionMetrics:
+        metrics = self.connections.get((ip, port))
+        if metrics is None:
+            metrics = self.__create(ip, port)
+
+        return metrics
+
+    def __create(self, ip: str, port: int) -> ConnectionMetrics:
+        # Peers are addressed by name when sending and by address when
+        # receiving, both have to end up on the same entry
+        address = self.__addresses.get(ip)
+        if address is None:
+            try:
+                address = socket.gethostbyname(ip)
+            except OSError:
+                address = ip
+            self.__addresses[ip] = address
+
+        # The SIGUSR1 dump reads the entries from another thread
+        with self.__lock:
+            metrics = self.connections.get((address, port))
+            if metrics is None:
+                metrics = ConnectionMetrics(f'{address}:{port}')
+                self.connections[(address, port)] = metrics
+
+            self.connections[(ip, port)] = metrics
+
+        return metrics
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            connections = list(self.connections.values())
+
+        return {metrics.peer: metrics.snapshot() for metrics in connections}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+
+        names = COUNTERS + ['goodput', 'window', 'srtt', 'rto']
+        for name in names:
+            metric = f'transfer_{name}_total' if name in COUNTERS else f'transfer_{name}'
+            lines.append(f'# TYPE {metric} {"counter" if name in COUNTERS else "gauge"}')
+
+            for peer, data in snapshot.items():
+                if data[name] is not None:
+                    lines.append(f'{metric}{{peer="{peer}"}} {data[name]}')
+
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: Optional[str] = None):
+        if path is None:
+            for peer, data in self.snapshot().items():
+                log.info('Metrics %s | %s', peer, json.dumps(data))
+            return
+
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        with open(path, 'w') as f:
+            f.write(text)
+
+        log.info('Metrics written to %s', path)
+
+    def install_signal_handler(self, path: Optional[str] = None):
+        # kill -USR1 <pid> dumps the current numbers without stopping the run,
+        # from a thread since the handler may interrupt a held logging lock
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.__dump_async(path))
+
+    def __dump_async(self, path: Optional[str]):
+        threading.Thread(target=self.dump, args=(path,), daemon=True).start()
@@ -0,0 +1,48 @@
+import time
+from typing import Optional
+
+from lib.congestion import CongestionControl
+from lib.sender import Sender
+
+
+class StreamMultiplexer:
+    senders: list[Sender]
+
+    def __init__(self, senders: list[Sender]):
+        self.senders = senders
+        self.__next = 0
+
+    @property
+    def deadline(self) -> Optional[float]:
+        deadlines = [sender.deadline for sender in self.senders if sender.deadline is not None]
+
+        return min(deadlines, default=None)
+
+    @property
+    def congestion(self) -> CongestionControl:
+        return self.senders[0].congestion
+
+    def is_done(self) -> bool:
+        return all(sender.is_done() for sender in self.senders)
+
+    def send_window(self):
+        # Every stream gets a turn, starting one further each time so no
+        # stream always goes first into the socket buffer
+        count = len(self.senders)
+        for offset in range(count):
+            sender = self.senders[(self.__next + offset) % count]
+            if not sender.is_done():
+                sender.send_window()
+
+        self.__next = (self.__next + 1) % max(count, 1)
+
+    def handle_ack(self, ack_num: int, stream: int = 0):
+        if stream < len(self.senders):
+            self.senders[stream].handle_ack(ack_num)
+
+    def handle_timeout(self):
+        # A timeout only ever concerns its own stream, the others keep going
+        now = time.monotonic()
+        for sender in self.senders:
+            if sender.deadline is not None and sender.deadline <= now:
+                sender.handle_timeout()
@@ -0,0 +1,131 @@
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+from lib.compression import get_codec
+from lib.constant import GO_BACK_N, SELECTIVE_REPEAT, REORDER_BUFFER_SIZE, MAX_STREAMS, VERSION_SIZE
+
+OPTION_MODE = 1
+OPTION_WINDOW = 2
+OPTION_DUPLEX = 3
+OPTION_STREAMS = 4
+OPTION_MANIFEST = 5
+OPTION_VERSIONS = 6
+OPTION_RESUME = 7
+OPTION_COMPRESSION = 8
+OPTION_SIGNATURES = 9
+
+RESUME = struct.Struct('!BI')
+
+PROTOCOLS = {
+    'gbn': GO_BACK_N,
+    'sr': SELECTIVE_REPEAT
+}
+
+
+@dataclass
+class HandshakeOptions:
+    mode: int
+    window: int
+    duplex: Optional[int]
+    streams: int
+    manifest: int
+    versions: list[bytes]
+    resume: dict[int, int]
+    compression: list[int]
+    signatures: bytes
+
+    def __init__(
+            self,
+            mode: int = GO_BACK_N,
+            window: int = 0,
+            duplex: Optional[int] = None,
+            streams: int = 1,
+            manifest: int = 0,
+            versions: Optional[list[bytes]] = None,
+            resume: Optional[dict[int, int]] = None,
+            compression: Optional[list[int]] = None,
+            signatures: bytes = b''
+    ):
+        self.mode = mode
+        self.window = window
+        self.duplex = duplex
+        self.streams = streams
+        self.manifest = manifest
+        self.versions = versions if versions is not None else []
+        self.resume = resume if resume is not None else {}
+        self.compression = compression if compression is not None else []
+        self.signatures = signatures
+
+    def get_bytes(self) -> bytes:
+        data = b''
+
+        if self.mode != GO_BACK_N:
+            data += HandshakeOptions.__pack_option(OPTION_MODE, struct.pack('!B', self.mode))
+        if self.window:
+            data += HandshakeOptions.__pack_option(OPTION_WINDOW, struct.pack('!I', self.window))
+        if self.duplex is not None:
+            data += HandshakeOptions.__pack_option(OPTION_DUPLEX, struct.pack('!B', self.duplex))
+        if self.streams > 1:
+            data += HandshakeOptions.__pack_option(OPTION_STREAMS, struct.pack('!B', self.streams))
+        if self.manifest:
+            data += HandshakeOptions.__pack_option(OPTION_MANIFEST, struct.pack('!B', self.manifest))
+        if self.versions:
+            data += HandshakeOptions.__pack_option(OPTION_VERSIONS, b''.join(self.versions))
+        if self.resume:
+            value = b''.join(RESUME.pack(stream, seq_num) for stream, seq_num in sorted(self.resume.items()))
+            data += HandshakeOptions.__pack_option(OPTION_RESUME, value)
+        if self.compression:
+            data += HandshakeOptions.__pack_option(OPTION_COMPRESSION, bytes(self.compression))
+        if self.signatures:
+            data += HandshakeOptions.__pack_option(OPTION_SIGNATURES, self.signatures)
+
+        return data
+
+    def accept(self) -> "HandshakeOptions":
+        # Options the receiving side agrees to, anything it does not know
+        # falls back to the defaults
+        mode = self.mode if self.mode in PROTOCOLS.values() else GO_BACK_N
+        window = REORDER_BUFFER_SIZE if mode == SELECTIVE_REPEAT else 0
+        streams = min(self.streams, MAX_STREAMS)
+        codec = get_codec(self.compression)
+        compression = [codec.id] if codec is not None else []
+
+        return HandshakeOptions(
+            mode=mode, window=window, streams=streams, manifest=self.manifest, compression=compression
+        )
+
+    @staticmethod
+    def from_bytes(data: bytes) -> "HandshakeOptions":
+        options = HandshakeOptions()
+
+        offset = 0
+        while offset + 3 <= len(data):
+            kind, length = struct.unpack('!BH', data[offset:offset + 3])
+            value = data[offset + 3:offset + 3 + length]
+            offset += 3 + length
+
+            if kind == OPTION_MODE:
+                options.mode = value[0]
+            elif kind == OPTION_WINDOW:
+                options.window = struct.unpack('!I', value)[0]
+            elif kind == OPTION_DUPLEX:
+                options.duplex = value[0]
+            elif kind == OPTION_STREAMS:
+                options.streams = value[0]
+            elif kind == OPTION_MANIFEST:
+                options.manifest = value[0]
+            elif kind == OPTION_VERSIONS:
+                options.versions = [value[i:i + VERSION_SIZE] for i in range(0, len(value), VERSION_SIZE)]
+            elif kind == OPTION_SIGNATURES:
+                options.signatures = bytes(value)
+            elif kind == OPTION_COMPRESSION:
+                options.compression = list(value)
+            elif kind == OPTION_RESUME:
+                options.resume = dict(RESUME.iter_unpack(value[:len(value) // RESUME.size * RESUME.size]))
+
+        return options
+
+    @staticmethod
+    def __pack_option(kind: int, value: bytes) -> bytes:
+        return struct.pack('!BH', kind, len(value)) + value
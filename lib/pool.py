@@ -0,0 +1,29 @@
+from lib.constant import SEGMENT_SIZE, RECEIVE_POOL_SIZE
+
+
+class BufferPool:
+    buffer_size: int
+    capacity: int
+    allocated: int
+
+    def __init__(self, buffer_size: int = SEGMENT_SIZE, capacity: int = RECEIVE_POOL_SIZE):
+        self.buffer_size = buffer_size
+        self.capacity = capacity
+        self.allocated = 0
+        self.__free = []
+
+    def acquire(self) -> bytearray:
+        if self.__free:
+            return self.__free.pop()
+
+        self.allocated += 1
+
+        return bytearray(self.buffer_size)
+
+    def release(self, buffer: bytearray):
+        # Buffers beyond the capacity are left to the garbage collector
+        if len(buffer) == self.buffer_size and len(self.__free) < self.capacity:
+            self.__free.append(buffer)
+
+    def __len__(self):
+        return len(self.__free)
@@ -0,0 +1,175 @@
+import heapq
+import json
+import selectors
+import socket
+import threading
+import time
+from typing import Optional
+
+from lib.impairment import Impairment, Fate, Link
+from lib.log import get_logger
+
+log = get_logger(__name__)
+
+FORWARD = 'forward'
+BACKWARD = 'backward'
+
+
+class Proxy:
+    ip: str
+    port: int
+    target_ip: str
+    target_port: int
+    links: dict[str, Link]
+    stats: dict[str, dict[str, int]]
+
+    def __init__(
+        self,
+        port: int,
+        target_port: int,
+        forward: Optional[Impairment] = None,
+        backward: Optional[Impairment] = None,
+        seed: int = 0,
+        fates_path: Optional[str] = None,
+        replay_path: Optional[str] = None,
+        ip: str = '127.0.0.1',
+        target_ip: str = '127.0.0.1'
+    ):
+        self.ip = ip
+        self.port = port
+        self.target_ip = target_ip
+        self.target_port = target_port
+
+        replay = Proxy.load_fates(replay_path) if replay_path is not None else None
+        self.links = {
+            FORWARD: Link(forward or Impairment(), f'{seed}:{FORWARD}', replay and replay.get(FORWARD, {})),
+            BACKWARD: Link(backward or Impairment(), f'{seed}:{BACKWARD}', replay and replay.get(BACKWARD, {}))
+        }
+        self.stats = {
+            direction: {'received': 0, 'sent': 0, 'dropped': 0, 'corrupted': 0, 'duplicated': 0, 'reordered': 0}
+            for direction in self.links
+        }
+
+        self.__front = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.__front.bind((ip, port))
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.__front, selectors.EVENT_READ, None)
+        self.__upstreams = {}
+        self.__queue = []
+        self.__order = 0
+        self.__fates = open(fates_path, 'w') if fates_path is not None else None
+        self.__running = True
+        self.__thread = None
+
+    @staticmethod
+    def load_fates(path: str) -> dict[str, dict[int, Fate]]:
+        fates = {FORWARD: {}, BACKWARD: {}}
+
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+
+                data = json.loads(line)
+                fate = Fate.from_dict(data)
+                fates[data['direction']][fate.index] = fate
+
+        return fates
+
+    def start(self):
+        self.__thread = threading.Thread(target=self.run, daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+        if self.__thread is not None:
+            self.__thread.join()
+
+        self.close()
+
+    def close(self):
+        self.__selector.close()
+        self.__front.close()
+        for upstream in self.__upstreams.values():
+            upstream.close()
+
+        if self.__fates is not None:
+            self.__fates.close()
+            self.__fates = None
+
+    def run(self):
+        log.info('Proxying %s:%s to %s:%s', self.ip, self.port, self.target_ip, self.target_port)
+
+        while self.__running:
+            timeout = 0.1
+            if self.__queue:
+                timeout = min(timeout, max(0.0, self.__queue[0][0] - time.monotonic()))
+
+            for key, _ in self.__selector.select(timeout=timeout):
+                data, addr = key.fileobj.recvfrom(65536)
+
+                if key.fileobj is self.__front:
+                    self.__impair(FORWARD, self.__upstream(addr), data, (self.target_ip, self.target_port))
+                else:
+                    self.__impair(BACKWARD, self.__front, data, key.data)
+
+            self.__flush()
+
+    def __upstream(self, addr: tuple) -> socket.socket:
+        # Every sender gets its own upstream socket so replies can be routed
+        # back to it, the target only ever sees the proxy
+        upstream = self.__upstreams.get(addr)
+        if upstream is None:
+            upstream = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            upstream.bind((self.ip, 0))
+            self.__upstreams[addr] = upstream
+            self.__selector.register(upstream, selectors.EVENT_READ, addr)
+
+        return upstream
+
+    def __impair(self, direction: str, sock: socket.socket, data: bytes, addr: tuple):
+        link = self.links[direction]
+        stats = self.stats[direction]
+        fate = link.decide()
+        stats['received'] += 1
+
+        self.__record(direction, len(data), fate)
+
+        if fate.drop:
+            stats['dropped'] += 1
+            return
+
+        if fate.corrupt_offset is not None:
+            stats['corrupted'] += 1
+        if fate.copies > 1:
+            stats['duplicated'] += fate.copies - 1
+        if fate.reordered:
+            stats['reordered'] += 1
+
+        data = fate.apply(data)
+        departure = link.schedule(time.monotonic(), len(data), fate.delay)
+
+        for _ in range(fate.copies):
+            # The counter keeps packets due at the same time in arrival order
+            heapq.heappush(self.__queue, (departure, self.__order, direction, sock, data, addr))
+            self.__order += 1
+
+    def __record(self, direction: str, size: int, fate: Fate):
+        log.debug(
+            '%s #%s | %s bytes | drop %s | corrupt %s | copies %s | delay %.4f s',
+            direction, fate.index, size, fate.drop, fate.corrupt_offset, fate.copies, fate.delay
+        )
+
+        if self.__fates is not None:
+            self.__fates.write(json.dumps({'direction': direction, 'size': size, **fate.to_dict()}) + '\n')
+
+    def __flush(self):
+        now = time.monotonic()
+        while self.__queue and self.__queue[0][0] <= now:
+            _, _, direction, sock, data, addr = heapq.heappop(self.__queue)
+
+            try:
+                sock.sendto(data, addr)
+                self.stats[direction]['sent'] += 1
+            except OSError as e:
+                log.warning('Failed to deliver %s packet to %s:%s: %s', direction, addr[0], addr[1], e)
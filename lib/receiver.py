@@ -0,0 +1,48 @@
+from typing import Optional
+
+from lib.constant import SELECTIVE_REPEAT, REORDER_BUFFER_SIZE
+
+
+class ReorderBuffer:
+    capacity: int
+    selective: bool
+    expected: int
+    segments: dict[int, bytes]
+
+    def __init__(self, capacity: int, selective: bool = False):
+        self.capacity = capacity
+        self.selective = selective
+        self.expected = 0
+        self.segments = {}
+
+    def accepts(self, seq_num: int) -> bool:
+        return self.expected <= seq_num < self.expected + self.capacity
+
+    def push(self, seq_num: int, payload: bytes) -> list[tuple[int, bytes]]:
+        # The next expected payload is delivered straight from the receive
+        # buffer, anything held for later is copied out of it first
+        if self.accepts(seq_num) and seq_num not in self.segments:
+            self.segments[seq_num] = payload if seq_num == self.expected else bytes(payload)
+
+        delivered = []
+        while self.expected in self.segments:
+            delivered.append((self.expected, self.segments.pop(self.expected)))
+            self.expected += 1
+
+        return delivered
+
+    def get_ack_num(self, seq_num: int) -> Optional[int]:
+        if self.selective:
+            return seq_num if seq_num < self.expected + self.capacity else None
+
+        # Cumulative ACK of the last in-order segment, repeated for anything
+        # out of order so the sender sees duplicate ACKs
+        return self.expected - 1 if self.expected > 0 else None
+
+
+def create_reorder_buffer(mode: int) -> ReorderBuffer:
+    # Go-Back-N is the same receiver with room for exactly the next segment
+    if mode == SELECTIVE_REPEAT:
+        return ReorderBuffer(REORDER_BUFFER_SIZE, selective=True)
+
+    return ReorderBuffer(1)
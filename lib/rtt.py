@@ -0,0 +1,42 @@
+from typing import Optional
+
+from lib.constant import TIMEOUT, MIN_TIMEOUT, MAX_TIMEOUT, RTT_ALPHA, RTT_BETA
+
+
+class RttEstimator:
+    srtt: Optional[float]
+    rttvar: Optional[float]
+    rto: float
+    samples: int
+
+    def __init__(self, initial_rto: float = TIMEOUT):
+        self.srtt = None
+        self.rttvar = None
+        self.rto = initial_rto
+        self.samples = 0
+
+    def sample(self, rtt: float):
+        # Smoothed RTT and RTT variation as in RFC 6298; callers only pass
+        # samples of segments that were never retransmitted (Karn's rule)
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+
+        self.samples += 1
+
+        # RFC 6298 asks for a 1 s floor, Linux uses 200 ms. Anything much lower
+        # is below the scheduling jitter of a Python sender and only causes
+        # spurious retransmissions
+        self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    def backoff(self):
+        self.rto = min(self.rto * 2, MAX_TIMEOUT)
+
+    def __str__(self):
+        if self.srtt is None:
+            return f'srtt - | rttvar - | rto {self.rto * 1000:.1f} ms'
+
+        return f'srtt {self.srtt * 1000:.2f} ms | rttvar {self.rttvar * 1000:.2f} ms | rto {self.rto * 1000:.1f} ms'
@@ -1,163 +1,143 @@
-from dataclasses import dataclass
 import struct
+from typing import Optional
 
-from lib.constant import SYN_FLAG, ACK_FLAG, FIN_FLAG, MSG_FLAG
+from lib.checksum import checksum
+from lib.constant import SYN_FLAG, ACK_FLAG, FIN_FLAG, MSG_FLAG, MANIFEST_FLAG, COMPRESSED_FLAG, DELTA_FLAG
 
+# seq_num, ack_num, flags, stream, checksum
+HEADER = struct.Struct('!IIBBH')
+HEADER_SIZE = HEADER.size
 
-@dataclass
-class SegmentFlag:
-    syn: bool
-    fin: bool
-    ack: bool
 
-    def __init__(self, flag: int):
-        self.syn = True if (flag & SYN_FLAG) else False
-        self.ack = True if (flag & ACK_FLAG) else False
-        self.fin = True if (flag & FIN_FLAG) else False
-
-    def get_flag_bytes(self) -> bytes:
-        flag: int = 0
-
-        flag += SYN_FLAG if self.syn else 0
-        flag += ACK_FLAG if self.ack else 0
-        flag += FIN_FLAG if self.fin else 0
-
-        return struct.pack('!B', flag)
-
-
-@dataclass
 class Segment:
-    flags: SegmentFlag
+    __slots__ = ('flags', 'seq_num', 'ack_num', 'stream', 'checksum', 'payload')
+
+    flags: int
     seq_num: int
     ack_num: int
-    checksum: bytes
+    stream: int
+    checksum: int
     payload: bytes
 
+    def __init__(
+            self,
+            flags: int,
+            seq_num: int,
+            ack_num: int,
+            payload: bytes = b'',
+            checksum: Optional[int] = None,
+            stream: int = 0
+    ):
+        # Segments are immutable, fields are only ever set here and the
+        # checksum is computed once unless the received one is passed in
+        init = object.__setattr__
+        init(self, 'flags', flags)
+        init(self, 'seq_num', seq_num)
+        init(self, 'ack_num', ack_num)
+        init(self, 'stream', stream)
+        init(self, 'payload', payload)
+        init(self, 'checksum', self.calculate_checksum() if checksum is None else checksum)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'Segment is immutable, cannot set {name}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'Segment is immutable, cannot delete {name}')
+
     @staticmethod
-    def syn(seq_num: int) -> "Segment":
-        segment = Segment(
-            flags=SegmentFlag(SYN_FLAG),
-            seq_num=seq_num,
-            ack_num=0,
-            checksum=b'',
-            payload=b''
-        )
+    def syn(seq_num: int, payload: bytes = b'') -> "Segment":
+        return Segment(SYN_FLAG, seq_num, 0, payload)
 
-        segment.update_checksum()
+    @staticmethod
+    def ack(seq_num: int, ack_num: int, stream: int = 0) -> "Segment":
+        return Segment(ACK_FLAG, seq_num, ack_num, stream=stream)
 
-        return segment
+    @staticmethod
+    def syn_ack(payload: bytes = b'') -> "Segment":
+        return Segment(SYN_FLAG | ACK_FLAG, 0, 0, payload)
 
     @staticmethod
-    def ack(seq_num: int, ack_num: int) -> "Segment":
-        segment = Segment(
-            flags=SegmentFlag(ACK_FLAG),
-            seq_num=seq_num,
-            ack_num=ack_num,
-            checksum=b'',
-            payload=b''
-        )
+    def fin() -> "Segment":
+        return Segment(FIN_FLAG, 0, 0)
 
-        segment.update_checksum()
+    @staticmethod
+    def fin_ack(done: bool = False) -> "Segment":
+        # ack_num 1 tells the other side we are done in both directions
+        return Segment(FIN_FLAG | ACK_FLAG, 0, 1 if done else 0)
 
-        return segment
+    @staticmethod
+    def data(seq_num: int, payload: bytes, stream: int = 0, compressed: bool = False) -> "Segment":
+        return Segment(COMPRESSED_FLAG if compressed else MSG_FLAG, seq_num, 0, payload, stream=stream)
 
     @staticmethod
-    def syn_ack() -> "Segment":
-        segment = Segment(
-            flags=SegmentFlag(SYN_FLAG | ACK_FLAG),
-            seq_num=0,
-            ack_num=0,
-            checksum=b'',
-            payload=b''
-        )
+    def data_ack(seq_num: int, ack_num: int, payload: bytes) -> "Segment":
+        # A data segment that also acknowledges the other direction
+        return Segment(ACK_FLAG, seq_num, ack_num, payload)
 
-        segment.update_checksum()
+    @staticmethod
+    def metadata(file_name, file_ext, stream: int = 0, delta: bool = False) -> "Segment":
+        padded_file_name = file_name.ljust(256, '\x00')
+        padded_ext_name = file_ext.ljust(4, '\x00')
+        payload = struct.pack("256s4s", padded_file_name.encode(), padded_ext_name.encode())
 
-        return segment
+        return Segment(DELTA_FLAG if delta else MSG_FLAG, 0, 0, payload, stream=stream)
 
     @staticmethod
-    def fin() -> "Segment":
-        segment = Segment(
-            flags=SegmentFlag(FIN_FLAG),
-            seq_num=0,
-            ack_num=0,
-            checksum=b'',
-            payload=b''
-        )
+    def manifest(seq_num: int, payload: bytes, stream: int = 0) -> "Segment":
+        return Segment(MANIFEST_FLAG, seq_num, 0, payload, stream=stream)
 
-        segment.update_checksum()
+    def is_syn(self) -> bool:
+        return self.flags == SYN_FLAG
 
-        return segment
+    def is_syn_ack(self) -> bool:
+        return self.flags == SYN_FLAG | ACK_FLAG
 
-    @staticmethod
-    def fin_ack() -> "Segment":
-        segment = Segment(
-            flags=SegmentFlag(FIN_FLAG | ACK_FLAG),
-            seq_num=0,
-            ack_num=0,
-            checksum=b'',
-            payload=b''
-        )
+    def is_ack(self) -> bool:
+        return self.flags == ACK_FLAG and len(self.payload) == 0
 
-        segment.update_checksum()
+    def is_fin(self) -> bool:
+        return self.flags == FIN_FLAG
 
-        return segment
+    def is_fin_ack(self) -> bool:
+        return self.flags == FIN_FLAG | ACK_FLAG
 
-    @staticmethod
-    def metadata(file_name, file_ext) -> "Segment":
-        padded_file_name = file_name.ljust(256, '\x00')
-        padded_ext_name = file_ext.ljust(4, '\x00')
-        payload = struct.pack("256s4s", padded_file_name.encode(), padded_ext_name.encode())
-        segment = Segment(
-            flags=SegmentFlag(MSG_FLAG),
-            seq_num=0,
-            ack_num=0,
-            checksum=b'',
-            payload=payload
-        )
-
-        segment.update_checksum()
-
-        return segment
-
-    def get_bytes(self):
-        data = struct.pack('!I', self.seq_num)
-        data += struct.pack('!I', self.ack_num)
-        data += self.flags.get_flag_bytes()
-        data += b'\x00'
-        data += self.checksum
-        data += self.payload
+    def is_data(self) -> bool:
+        return self.flags & ~(MANIFEST_FLAG | COMPRESSED_FLAG | DELTA_FLAG) == MSG_FLAG
 
-        return data
+    def is_manifest(self) -> bool:
+        return self.flags == MANIFEST_FLAG
 
-    def calculate_checksum(self) -> bytes:
-        data = struct.pack('!I', self.seq_num)
-        data += struct.pack('!I', self.ack_num)
-        data += self.flags.get_flag_bytes()
-        data += b'\x00\x00\x00'
-        data += self.payload
+    def is_compressed(self) -> bool:
+        return self.flags == COMPRESSED_FLAG
 
-        xor_in = 0x0000
-        xor_out = 0x0000
-        poly = 0x8005
+    def is_delta(self) -> bool:
+        return self.flags == DELTA_FLAG
 
-        reg = xor_in
-        for octet in data:
-            for i in range(8):
-                topbit = reg & 0x8000
-                if octet & (0x80 >> i):
-                    topbit ^= 0x8000
-                reg <<= 1
-                if topbit:
-                    reg ^= poly
-            reg &= 0xFFFF
+    def is_data_ack(self) -> bool:
+        return self.flags == ACK_FLAG and len(self.payload) > 0
 
-        checksum = struct.pack('!H', reg ^ xor_out)
+    def pack_header(self, buffer, offset: int = 0):
+        HEADER.pack_into(buffer, offset, self.seq_num, self.ack_num, self.flags, self.stream, self.checksum)
 
-        return checksum
+    def get_bytes(self) -> bytearray:
+        data = bytearray(HEADER_SIZE + len(self.payload))
+        self.pack_header(data)
+        data[HEADER_SIZE:] = self.payload
+
+        return data
 
-    def update_checksum(self):
-        self.checksum = self.calculate_checksum()
+    def calculate_checksum(self) -> int:
+        # The checksum field counts as zero, the payload is hashed in place
+        crc = checksum(HEADER.pack(self.seq_num, self.ack_num, self.flags, self.stream, 0))
+
+        return checksum(self.payload, crc)
 
     def is_valid_checksum(self) -> bool:
-        return self.calculate_checksum() == self.checksum
\ No newline at end of file
+        return self.calculate_checksum() == self.checksum
+
+    def __len__(self):
+        return HEADER_SIZE + len(self.payload)
+
+    def __repr__(self):
+        return f'Segment(flags={self.flags:#04x}, seq_num={self.seq_num}, ack_num={self.ack_num}, stream={self.stream}, ' \
+               f'checksum={self.checksum:#06x}, payload={len(self.payload)} bytes)'
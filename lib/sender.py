@@ -0,0 +1,260 @@
+import time
+from typing import Callable, Optional
+
+from lib.connection import Connection
+from lib.congestion import CongestionControl, Reno
+from lib.constant import SELECTIVE_REPEAT, DUP_ACK_THRESHOLD
+from lib.log import get_logger
+from lib.metrics import ConnectionMetrics
+from lib.rtt import RttEstimator
+from lib.segment import Segment
+
+log = get_logger(__name__)
+
+
+class Sender:
+    connection: Connection
+    ip: str
+    port: int
+    total_segment: int
+    congestion: CongestionControl
+    seq_base: int
+    next_seq: int
+    recover: int
+    dup_acks: int
+    rtt: RttEstimator
+    sent_at: dict[int, float]
+    sizes: dict[int, int]
+    retransmitted: set[int]
+    metrics: ConnectionMetrics
+
+    def __init__(
+            self,
+            connection: Connection,
+            ip: str,
+            port: int,
+            total_segment: int,
+            get_segment: Callable[[int], Segment],
+            rtt: Optional[RttEstimator] = None,
+            congestion: Optional[CongestionControl] = None,
+            start: int = 0,
+            get_size: Optional[Callable[[int], int]] = None
+    ):
+        self.connection = connection
+        self.ip = ip
+        self.port = port
+        self.total_segment = total_segment
+        self.get_segment = get_segment
+        self.get_size = get_size
+        self.rtt = rtt if rtt is not None else RttEstimator()
+        self.congestion = congestion if congestion is not None else Reno()
+
+        # A resumed transfer starts past the segments the receiver already has
+        self.seq_base = start
+        self.next_seq = start
+        self.recover = start
+        self.dup_acks = 0
+        self.timer = None
+        self.sent_at = {}
+        self.sizes = {}
+        self.retransmitted = set()
+
+        self.metrics = connection.metrics.get(ip, port)
+        self.metrics.track(rtt=self.rtt, congestion=self.congestion)
+        self.metrics.start()
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return self.timer
+
+    @property
+    def window_size(self) -> int:
+        return self.congestion.window
+
+    def is_done(self) -> bool:
+        return self.seq_base >= self.total_segment
+
+    def send_window(self):
+        window_end = min(self.seq_base + self.window_size, self.total_segment)
+
+        self.send_segments(range(self.next_seq, window_end))
+        self.next_seq = max(self.next_seq, window_end)
+
+        if self.timer is None and self.seq_base < self.next_seq:
+            self.timer = time.monotonic() + self.rtt.rto
+
+    def send_segment(self, seq_num: int):
+        self.send_segments([seq_num])
+
+    def send_segments(self, seq_nums):
+        if not seq_nums:
+            return
+
+        # The whole batch is handed to the connection at once so it can go
+        # out in as few syscalls as the socket allows
+        segments = [self.get_segment(seq_num) for seq_num in seq_nums]
+        self.connection.send_segments(self.ip, self.port, segments)
+
+        now = time.monotonic()
+        for seq_num, segment in zip(seq_nums, segments):
+            log.debug('Sending segment %s to %s:%s', seq_num, self.ip, self.port)
+
+            if seq_num in self.sent_at:
+                self.retransmitted.add(seq_num)
+                self.metrics.retransmissions += 1
+            else:
+                self.sent_at[seq_num] = now
+                self.sizes[seq_num] = self.get_size(seq_num) if self.get_size is not None else len(segment.payload)
+
+    def on_delivered(self, seq_num: int):
+        self.metrics.deliver(self.sizes.pop(seq_num, 0))
+
+    def sample_rtt(self, seq_num: int):
+        sent_at = self.sent_at.pop(seq_num, None)
+
+        # Karn's rule: an ACK for a retransmitted segment is ambiguous
+        if seq_num in self.retransmitted:
+            self.retransmitted.discard(seq_num)
+        elif sent_at is not None:
+            self.rtt.sample(time.monotonic() - sent_at)
+
+    def handle_ack(self, ack_num: int):
+        log.debug('Received ACK response %s from %s:%s', ack_num, self.ip, self.port)
+
+        # ACKs are cumulative: ack_num covers every segment up to and
+        # including itself
+        if self.seq_base <= ack_num < self.next_seq:
+            self.sample_rtt(ack_num)
+
+            for seq_num in range(self.seq_base, ack_num):
+                self.sent_at.pop(seq_num, None)
+                self.retransmitted.discard(seq_num)
+                self.on_delivered(seq_num)
+                self.congestion.on_ack(self.rtt)
+
+            self.on_delivered(ack_num)
+            self.congestion.on_ack(self.rtt)
+
+            self.seq_base = ack_num + 1
+            self.dup_acks = 0
+            self.timer = time.monotonic() + self.rtt.rto if self.seq_base < self.next_seq else None
+
+        elif ack_num == self.seq_base - 1 and self.seq_base < self.next_seq:
+            self.dup_acks += 1
+            self.metrics.duplicate_acks += 1
+
+            if self.dup_acks == DUP_ACK_THRESHOLD:
+                self.fast_retransmit()
+
+    def fast_retransmit(self):
+        log.warning('Duplicate ACKs from %s:%s, fast retransmit from segment %s', self.ip, self.port, self.seq_base)
+
+        self.on_loss()
+
+        # A Go-Back-N receiver dropped everything after the gap, so every
+        # outstanding segment is missing and gets resent by send_window
+        self.next_seq = self.seq_base
+        self.timer = None
+
+    def on_loss(self):
+        # React once per window of data, later signals for the same window
+        # describe the same loss
+        if self.seq_base >= self.recover:
+            self.congestion.on_loss()
+            self.recover = self.next_seq
+
+    def handle_timeout(self):
+        log.warning('Timeout error: no ACK from %s:%s for segment %s', self.ip, self.port, self.seq_base)
+
+        self.metrics.timeouts += 1
+        self.rtt.backoff()
+        self.congestion.on_timeout()
+        self.recover = self.next_seq
+        self.dup_acks = 0
+        self.next_seq = self.seq_base
+        self.timer = None
+
+
+class SelectiveRepeatSender(Sender):
+    acked: set[int]
+    timers: dict[int, float]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.acked = set()
+        self.timers = {}
+
+    @property
+    def deadline(self) -> Optional[float]:
+        return min(self.timers.values(), default=None)
+
+    def send_window(self):
+        window_end = min(self.seq_base + self.window_size, self.total_segment)
+        seq_nums = range(self.next_seq, window_end)
+
+        self.send_segments(seq_nums)
+
+        deadline = time.monotonic() + self.rtt.rto
+        for seq_num in seq_nums:
+            self.timers[seq_num] = deadline
+
+        self.next_seq = max(self.next_seq, window_end)
+
+    def handle_ack(self, ack_num: int):
+        log.debug('Received ACK response %s from %s:%s', ack_num, self.ip, self.port)
+
+        if ack_num < self.seq_base or ack_num >= self.next_seq or ack_num in self.acked:
+            return
+
+        self.sample_rtt(ack_num)
+        self.on_delivered(ack_num)
+        self.congestion.on_ack(self.rtt)
+        self.acked.add(ack_num)
+        self.timers.pop(ack_num, None)
+
+        if ack_num == self.seq_base:
+            while self.seq_base in self.acked:
+                self.acked.remove(self.seq_base)
+                self.seq_base += 1
+
+            self.dup_acks = 0
+            return
+
+        # Later segments keep arriving while the base is missing
+        self.dup_acks += 1
+        self.metrics.duplicate_acks += 1
+        if self.dup_acks == DUP_ACK_THRESHOLD:
+            self.fast_retransmit()
+
+    def fast_retransmit(self):
+        log.warning('Duplicate ACKs from %s:%s, fast retransmit segment %s', self.ip, self.port, self.seq_base)
+
+        self.on_loss()
+        self.send_segment(self.seq_base)
+        self.timers[self.seq_base] = time.monotonic() + self.rtt.rto
+
+    def handle_timeout(self):
+        now = time.monotonic()
+        expired = [seq_num for seq_num, deadline in self.timers.items() if deadline <= now]
+
+        if expired:
+            self.metrics.timeouts += len(expired)
+            self.rtt.backoff()
+
+            if self.seq_base >= self.recover:
+                self.congestion.on_timeout()
+                self.recover = self.next_seq
+
+        for seq_num in expired:
+            log.warning('Timeout error: no ACK from %s:%s for segment %s', self.ip, self.port, seq_num)
+            self.timers[seq_num] = now + self.rtt.rto
+
+        self.send_segments(sorted(expired))
+
+
+def create_sender(mode: int, *args, **kwargs) -> Sender:
+    if mode == SELECTIVE_REPEAT:
+        return SelectiveRepeatSender(*args, **kwargs)
+
+    return Sender(*args, **kwargs)
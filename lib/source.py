@@ -0,0 +1,216 @@
+import hashlib
+import mmap
+import os
+from bisect import bisect_right
+from itertools import accumulate
+from math import ceil
+from typing import Optional
+
+from lib.constant import PAYLOAD_SIZE, VERSION_SIZE
+from lib.delta import COPY, COPY_HEADER, LITERAL_HEADER, Signatures, compute_delta
+from lib.manifest import Manifest
+
+
+class FileSource:
+    path: str
+    size: int
+    total_segment: int
+    version: bytes
+
+    def __init__(self, path: str, payload_size: int = PAYLOAD_SIZE):
+        self.path = path
+        self.payload_size = payload_size
+
+        self.__file = open(path, 'rb')
+        stat = os.fstat(self.__file.fileno())
+        self.size = stat.st_size
+        self.total_segment = ceil(self.size / payload_size)
+
+        # A receiver only resumes a transfer if the file has not changed since
+        self.version = hashlib.blake2b(
+            f'{stat.st_size}:{stat.st_mtime_ns}:{payload_size}'.encode(), digest_size=VERSION_SIZE
+        ).digest()
+
+        # Empty files cannot be mapped, they simply have no segments
+        self.__released = 0
+        self.__map = None
+        self.__view = memoryview(b'')
+        if self.size > 0:
+            self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__map)
+            self.__advise()
+
+    def __advise(self):
+        # Segments are read front to back, let the kernel read ahead of the
+        # sender and drop pages behind it
+        if hasattr(self.__map, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.__map.madvise(mmap.MADV_SEQUENTIAL)
+
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self.__file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def get_payload(self, index: int) -> memoryview:
+        offset = index * self.payload_size
+
+        return self.__view[offset:offset + self.payload_size]
+
+    def read(self, offset: int = 0, length: Optional[int] = None) -> memoryview:
+        end = self.size if length is None else offset + length
+
+        return self.__view[offset:end]
+
+    def release(self, index: int):
+        # Segments before index are acknowledged and never read again, drop
+        # their pages so only the window and the read-ahead stay resident
+        end = min(index * self.payload_size, self.size) // mmap.PAGESIZE * mmap.PAGESIZE
+        if self.__map is None or end <= self.__released:
+            return
+
+        if hasattr(self.__map, 'madvise') and hasattr(mmap, 'MADV_DONTNEED'):
+            self.__map.madvise(mmap.MADV_DONTNEED, self.__released, end - self.__released)
+
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(self.__file.fileno(), self.__released, end - self.__released, os.POSIX_FADV_DONTNEED)
+
+        self.__released = end
+
+    def close(self):
+        self.__view.release()
+        if self.__map is not None:
+            self.__map.close()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DirectorySource:
+    path: str
+    manifest: Manifest
+    size: int
+    total_segment: int
+    version: bytes
+
+    def __init__(self, path: str, payload_size: int = PAYLOAD_SIZE):
+        self.path = path
+        self.payload_size = payload_size
+        self.manifest = Manifest.from_directory(path)
+        self.size = self.manifest.size
+        self.total_segment = ceil(self.size / payload_size)
+
+        # The files are sent back to back as one byte stream, so small files
+        # share segments instead of each taking one of their own
+        self.__paths = [os.path.join(path, *relative_path.split('/')) for relative_path, _ in self.manifest.entries]
+        self.__sizes = [size for _, size in self.manifest.entries]
+        self.__offsets = list(accumulate(self.__sizes, initial=0))[:-1]
+
+        version = hashlib.blake2b(self.manifest.get_bytes(), digest_size=VERSION_SIZE)
+        version.update(str(payload_size).encode())
+        for file_path in self.__paths:
+            version.update(str(os.stat(file_path).st_mtime_ns).encode())
+        self.version = version.digest()
+        self.__index = None
+        self.__fd = None
+
+    def get_payload(self, index: int) -> bytes:
+        start = index * self.payload_size
+        end = min(start + self.payload_size, self.size)
+
+        parts = []
+        entry = bisect_right(self.__offsets, start) - 1
+        while start < end:
+            entry_end = self.__offsets[entry] + self.__sizes[entry]
+            if entry_end > start:
+                length = min(end, entry_end) - start
+                parts.append(self.__read(entry, start - self.__offsets[entry], length))
+                start += length
+
+            entry += 1
+
+        return b''.join(parts)
+
+    def __read(self, entry: int, offset: int, length: int) -> bytes:
+        # Only one file is kept open at a time, reads mostly move forward
+        if self.__index != entry:
+            self.__close_file()
+            self.__fd = os.open(self.__paths[entry], os.O_RDONLY)
+            self.__index = entry
+
+        return os.pread(self.__fd, length, offset)
+
+    def __close_file(self):
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
+            self.__index = None
+
+    def close(self):
+        self.__close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DeltaSource:
+    path: str
+    size: int
+    total_segment: int
+    copied: int
+    literal: int
+
+    def __init__(self, source: FileSource, signatures: Signatures, payload_size: int = PAYLOAD_SIZE):
+        self.path = source.path
+        self.payload_size = payload_size
+        self.__source = source
+
+        # The file is sent as copy and literal instructions against the
+        # receiver's old copy, literals are read from the file when sent
+        self.__entries = []
+        self.__starts = []
+        self.copied = 0
+        self.literal = 0
+        offset = 0
+        for kind, start, length in compute_delta(source.read(), signatures):
+            if kind == COPY:
+                header = COPY_HEADER.pack(kind, start, length)
+                self.__entries.append((header, 0, 0))
+                self.copied += length * signatures.block_size
+            else:
+                header = LITERAL_HEADER.pack(kind, length)
+                self.__entries.append((header, start, length))
+                self.literal += length
+
+            self.__starts.append(offset)
+            offset += len(header) + self.__entries[-1][2]
+
+        self.size = offset
+        self.total_segment = ceil(self.size / payload_size)
+
+    def get_payload(self, index: int) -> bytes:
+        start = index * self.payload_size
+        end = min(start + self.payload_size, self.size)
+
+        parts = []
+        entry = bisect_right(self.__starts, start) - 1
+        while start < end:
+            header, offset, length = self.__entries[entry]
+            entry_start = self.__starts[entry]
+            local_start = start - entry_start
+            local_end = min(end - entry_start, len(header) + length)
+
+            if local_start < len(header):
+                parts.append(header[local_start:min(local_end, len(header))])
+            if local_end > len(header):
+                literal_start = max(local_start, len(header)) - len(header)
+                parts.append(self.__source.read(offset + literal_start, local_end - len(header) - literal_start))
+
+            start = entry_start + local_end
+            entry += 1
+
+        return b''.join(parts)
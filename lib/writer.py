@@ -0,0 +1,266 @@
+import os
+
+from lib.constant import WRITE_BUFFER_SIZE
+from lib.delta import COPY, LITERAL, COPY_HEADER, LITERAL_HEADER
+from lib.manifest import Manifest
+
+
+class FileWriter:
+    path: str
+    temp_path: str
+    size: int
+
+    def __init__(self, path: str, buffer_size: int = WRITE_BUFFER_SIZE, offset: int = 0):
+        self.path = path
+        self.temp_path = f'{path}.part'
+        self.size = offset
+
+        # Payloads go to disk as they arrive in order, only the bounded write
+        # buffer is kept in memory no matter how large the file is
+        if offset > 0:
+            # Resuming: anything written after the last checkpoint is dropped
+            self.__file = open(self.temp_path, 'r+b', buffering=buffer_size)
+            self.__file.truncate(offset)
+            self.__file.seek(offset)
+        else:
+            self.__file = open(self.temp_path, 'wb', buffering=buffer_size)
+
+    @staticmethod
+    def can_resume(path: str, offset: int) -> bool:
+        # The partial file must still hold everything the checkpoint counted
+        temp_path = f'{path}.part'
+
+        return offset == 0 or (os.path.isfile(temp_path) and os.path.getsize(temp_path) >= offset)
+
+    def write(self, payload: bytes):
+        self.__file.write(payload)
+        self.size += len(payload)
+
+    def sync(self):
+        if self.__file.closed:
+            return
+
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    def commit(self):
+        self.sync()
+        self.__file.close()
+
+        # The output path only ever holds a complete file
+        os.replace(self.temp_path, self.path)
+
+    def close(self):
+        # Keeps the partial file so the transfer can be resumed
+        self.__file.close()
+
+    def abort(self):
+        if self.__file.closed:
+            return
+
+        self.__file.close()
+        os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+
+
+class DirectoryWriter:
+    path: str
+    manifest: Manifest
+    size: int
+
+    def __init__(self, path: str, manifest: Manifest, buffer_size: int = WRITE_BUFFER_SIZE, offset: int = 0):
+        self.path = path
+        self.manifest = manifest
+        self.size = offset
+        self.buffer_size = buffer_size
+
+        # Files are rebuilt in manifest order from the one byte stream, each
+        # is finalized as soon as its last byte arrives
+        self.__entry = 0
+        self.__start = 0
+        self.__remaining = 0
+        self.__writer = None
+        self.__next_file()
+
+    @staticmethod
+    def can_resume(path: str, manifest: Manifest, offset: int) -> bool:
+        start = 0
+        for relative_path, size in manifest.entries:
+            if start >= offset:
+                break
+
+            file_path = os.path.join(path, *relative_path.split('/'))
+            complete = os.path.isfile(file_path) and os.path.getsize(file_path) == size
+            if not complete and (start + size <= offset or not FileWriter.can_resume(file_path, offset - start)):
+                return False
+
+            start += size
+
+        return True
+
+    def __next_file(self):
+        while self.__entry < len(self.manifest.entries):
+            relative_path, size = self.manifest.entries[self.__entry]
+            start = self.__start
+            self.__entry += 1
+            self.__start += size
+
+            # Files that were finished before a resumed transfer stopped are
+            # already in place
+            if start < self.size and start + size <= self.size:
+                continue
+
+            path = os.path.join(self.path, *relative_path.split('/'))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            offset = max(0, self.size - start)
+
+            # A file finished after the checkpoint was taken is reopened at
+            # the checkpointed offset
+            temp_path = f'{path}.part'
+            if offset > 0 and not os.path.exists(temp_path) and os.path.isfile(path):
+                os.replace(path, temp_path)
+
+            self.__writer = FileWriter(path, self.buffer_size, offset)
+            self.__remaining = size - offset
+            if self.__remaining > 0:
+                return
+
+            self.__writer.commit()
+
+        self.__writer = None
+
+    def write(self, payload: bytes):
+        view = memoryview(payload)
+
+        while view:
+            if self.__writer is None:
+                raise ValueError(f'Received more data than the manifest of {self.path} lists')
+
+            chunk = view[:self.__remaining]
+            self.__writer.write(chunk)
+            self.__remaining -= len(chunk)
+            self.size += len(chunk)
+            view = view[len(chunk):]
+
+            if self.__remaining == 0:
+                self.__writer.commit()
+                self.__next_file()
+
+    def sync(self):
+        if self.__writer is not None:
+            self.__writer.sync()
+
+    def commit(self):
+        if self.__writer is not None:
+            raise ValueError(f'Transfer of {self.path} ended before {self.__writer.path}')
+
+    def close(self):
+        if self.__writer is not None:
+            self.__writer.close()
+
+    def abort(self):
+        if self.__writer is not None:
+            self.__writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+
+
+class DeltaWriter:
+    basis_path: str
+    block_size: int
+
+    def __init__(self, path: str, basis_path: str, block_size: int, buffer_size: int = WRITE_BUFFER_SIZE):
+        self.basis_path = basis_path
+        self.block_size = block_size
+
+        # The new file is rebuilt next to the old one, which stays in place
+        # until the commit replaces it
+        self.__writer = FileWriter(path, buffer_size)
+        self.__basis = open(basis_path, 'rb')
+        self.__header = bytearray()
+        self.__literal = 0
+
+    @property
+    def path(self) -> str:
+        return self.__writer.path
+
+    @property
+    def size(self) -> int:
+        return self.__writer.size
+
+    def write(self, payload: bytes):
+        view = memoryview(payload)
+
+        while view:
+            if self.__literal > 0:
+                chunk = view[:self.__literal]
+                self.__writer.write(chunk)
+                self.__literal -= len(chunk)
+                view = view[len(chunk):]
+                continue
+
+            # Instruction headers may be split across segments
+            kind = bytes(self.__header[:1] or view[:1])
+            header_size = COPY_HEADER.size if kind == COPY else LITERAL_HEADER.size
+            needed = header_size - len(self.__header)
+            self.__header += view[:needed]
+            view = view[needed:]
+
+            if len(self.__header) == header_size:
+                self.__apply(bytes(self.__header))
+                self.__header.clear()
+
+    def __apply(self, header: bytes):
+        if header[:1] == COPY:
+            _, index, count = COPY_HEADER.unpack(header)
+
+            self.__basis.seek(index * self.block_size)
+            for _ in range(count):
+                block = self.__basis.read(self.block_size)
+                if len(block) < self.block_size:
+                    raise ValueError(f'Block {index} is missing from {self.basis_path}')
+
+                self.__writer.write(block)
+
+        elif header[:1] == LITERAL:
+            _, self.__literal = LITERAL_HEADER.unpack(header)
+
+        else:
+            raise ValueError(f'Unknown delta instruction {header[:1]!r}')
+
+    def sync(self):
+        self.__writer.sync()
+
+    def commit(self):
+        if self.__header or self.__literal:
+            raise ValueError(f'Delta for {self.path} ended in the middle of an instruction')
+
+        self.__basis.close()
+        self.__writer.commit()
+
+    def close(self):
+        self.__basis.close()
+        self.__writer.close()
+
+    def abort(self):
+        self.__basis.close()
+        self.__writer.abort()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
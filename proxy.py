@@ -0,0 +1,58 @@
+import argparse
+import signal
+
+from lib.constant import LOG_LEVEL, LOG_RATE_LIMIT
+from lib.impairment import Impairment
+from lib.log import LEVELS, get_logger, setup_logging
+from lib.proxy import Proxy
+
+log = get_logger(__name__)
+
+
+def interrupt(signum, frame):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('proxy_port', type=int)
+    parser.add_argument('target_port', type=int)
+    parser.add_argument('--impair', type=Impairment.parse, default=None)
+    parser.add_argument('--forward', type=Impairment.parse, default=None)
+    parser.add_argument('--backward', type=Impairment.parse, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fates', default=None)
+    parser.add_argument('--replay', default=None)
+    parser.add_argument('--log-level', choices=LEVELS.keys(), default=LOG_LEVEL)
+    parser.add_argument('--log-rate', type=float, default=LOG_RATE_LIMIT)
+    args = parser.parse_args()
+
+    setup_logging(args.log_level, args.log_rate)
+
+    proxy = Proxy(
+        port=args.proxy_port,
+        target_port=args.target_port,
+        forward=args.forward or args.impair,
+        backward=args.backward or args.impair,
+        seed=args.seed,
+        fates_path=args.fates,
+        replay_path=args.replay
+    )
+
+    # Stopping the proxy with kill still prints the summary, once: timeout(1)
+    # signals both the child and its process group
+    signal.signal(signal.SIGTERM, interrupt)
+
+    try:
+        proxy.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.close()
+
+    for direction, stats in proxy.stats.items():
+        log.info('%s | %s', direction, ' | '.join(f'{count} {name}' for name, count in stats.items()))
+
+
+main()
@@ -1,11 +1,31 @@
-import sys
+import argparse
+import functools
 import os
+import selectors
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from math import ceil
-from lib.connection import Node, Connection, MessageInfo
-from lib.constant import BLOCKING, TIMEOUT, PAYLOAD_SIZE, WINDOW_SIZE, MSG_FLAG
+from typing import Callable, Optional, Union
+
+from lib.connection import Node, Connection, MessageInfo, parse_address
+from lib.broadcast import BroadcastGroup, GroupMember
+from lib.cache import SegmentCache
+from lib.compression import CODECS, COMPRESSIONS, Compressor, get_codec
+from lib.congestion import CONGESTION_CONTROLS, create_congestion_control
+from lib.delta import Signatures
+from lib.constant import BLOCKING, CACHE_SIZE, GO_BACK_N, PAYLOAD_SIZE, \
+    SELECTIVE_REPEAT, MAX_WINDOW_SIZE, MAX_STREAMS, LOG_LEVEL, LOG_RATE_LIMIT, \
+    COMPRESSION_AHEAD, COMPRESSION_SAMPLES, COMPRESSION_RATIO, COMPRESSION_MISSES, DELTA_POLL
 from lib.exception import InvalidChecksumError
-from lib.segment import Segment, SegmentFlag
+from lib.log import LEVELS, get_logger, setup_logging, flush_logging
+from lib.multiplex import StreamMultiplexer
+from lib.options import HandshakeOptions, PROTOCOLS
+from lib.rtt import RttEstimator
+from lib.segment import Segment
+from lib.sender import create_sender
+from lib.source import FileSource, DirectorySource, DeltaSource
+
+log = get_logger(__name__)
 
 
 class ListeningClient:
@@ -17,39 +37,182 @@ class ListeningClient:
         self.port = port
 
 
+class ClientSession:
+    HANDSHAKE = 'handshake'
+    DELTA = 'delta'
+    DATA = 'data'
+    FIN = 'fin'
+    DONE = 'done'
+
+    client: ListeningClient
+    sender: Union[StreamMultiplexer, GroupMember, None]
+    state: str
+    deadline: Optional[float]
+    rtt: RttEstimator
+    sent_at: Optional[float]
+    delta: Optional[DeltaSource]
+    pending: Optional[Future]
+    on_delta: Optional[Callable[[], None]]
+
+    def __init__(self, client: ListeningClient):
+        self.client = client
+        self.sender = None
+        self.state = ClientSession.HANDSHAKE
+        self.deadline = None
+        self.rtt = RttEstimator()
+        self.sent_at = None
+        self.delta = None
+        self.pending = None
+        self.on_delta = None
+
+    def start_timer(self, retransmit: bool = False):
+        now = time.monotonic()
+
+        # Karn's rule: only time control segments that were sent once
+        self.sent_at = None if retransmit else now
+        self.deadline = now + self.rtt.rto
+
+    def sample_rtt(self):
+        if self.sent_at is not None:
+            self.rtt.sample(time.monotonic() - self.sent_at)
+            self.sent_at = None
+
+    def get_deadline(self) -> Optional[float]:
+        if self.state == ClientSession.DATA:
+            return self.sender.deadline
+
+        return self.deadline
+
+    def handle_ack(self, segment: Segment):
+        if isinstance(self.sender, StreamMultiplexer):
+            self.sender.handle_ack(segment.ack_num, segment.stream)
+        else:
+            self.sender.handle_ack(segment.ack_num)
+
+
 @dataclass
 class Server(Node):
-    data: bytes
-    input_path: str
+    input_paths: list[str]
     clients: list[ListeningClient]
-    file_path: str
-    file_size: int
-
-    def __init__(self, input_path: str, ip: str = "localhost", port: int = 8000):
+    file_paths: list[str]
+    sources: list[Union[FileSource, DirectorySource]]
+    headers: list[list[Segment]]
+    file_sizes: list[int]
+    cache: SegmentCache
+    total_segments: list[int]
+    mode: str
+    group: Optional[tuple[str, int]]
+    options: HandshakeOptions
+    congestion: str
+    max_window: int
+    metrics_path: Optional[str]
+    compressors: dict[int, Compressor]
+    compressible: dict[tuple[int, int], bool]
+
+    def __init__(
+            self,
+            input_paths: list[str],
+            ip: str = "localhost",
+            port: int = 8000,
+            cache_size: int = CACHE_SIZE,
+            mode: str = 'sequential',
+            group: Optional[tuple[str, int]] = None,
+            protocol: int = GO_BACK_N,
+            congestion: str = 'reno',
+            max_window: int = MAX_WINDOW_SIZE,
+            offload: bool = False,
+            metrics_path: Optional[str] = None,
+            compression: Optional[int] = None
+    ):
         super().__init__()
         self.clients = []
+        self.mode = mode
+        self.group = group
+        self.options = HandshakeOptions(mode=protocol, streams=len(input_paths))
+        self.congestion = congestion
+        self.max_window = max_window
+        self.metrics_path = metrics_path
+        self.cache = SegmentCache(cache_size)
         self.connection = Connection(ip=ip, port=port)
-        self.file_path = input_path
+        self.file_paths = input_paths
+        self.compressors = {}
+        self.compressible = {}
+        self.__misses = {}
+        self.__samples = {}
+        self.__delta_executor = None
+
+        if self.group is not None:
+            self.connection.enable_multicast()
+            log.info('Broadcasting to multicast group %s:%s', self.group[0], self.group[1])
+
+        log.info('Server started at %s:%s', self.connection.ip, self.connection.port)
+
+        if offload:
+            self.__enable_offload()
+
+        # Every input is a stream of its own, a file starts with its metadata
+        # segment and a directory with the manifest of the files that follow
+        self.sources = [
+            DirectorySource(input_path) if os.path.isdir(input_path) else FileSource(input_path)
+            for input_path in input_paths
+        ]
+        self.headers = [self.__get_header_segments(stream) for stream in range(len(self.sources))]
+        self.file_sizes = [source.size for source in self.sources]
+        self.total_segments = [
+            len(headers) + source.total_segment for headers, source in zip(self.headers, self.sources)
+        ]
+        for stream, input_path in enumerate(input_paths):
+            source = self.sources[stream]
+            if isinstance(source, DirectorySource):
+                self.options.manifest = 1
+                log.info(
+                    'Source directory | stream %s | %s | %s files | %s bytes',
+                    stream, input_path, len(source.manifest.entries), self.file_sizes[stream]
+                )
+            else:
+                log.info('Source file | stream %s | %s | %s bytes', stream, input_path, self.file_sizes[stream])
+
+        # Receivers resume unchanged files from their checkpoint, a broadcast
+        # group always starts from the beginning
+        if self.mode != 'broadcast':
+            self.options.versions = [source.version for source in self.sources]
 
-        print(f'[!] Server started at {self.connection.ip}:{self.connection.port}')
+        # The preferred codec is offered first and the others as fallbacks,
+        # a broadcast group shares segments so it is never compressed
+        if compression is not None and self.mode != 'broadcast':
+            self.options.compression = [compression] + [codec_id for codec_id in CODECS if codec_id != compression]
 
-        self.file_size = os.path.getsize(input_path)
-        print(f'[!] Source file | {input_path} | {self.file_size} bytes')
+    def __enable_offload(self):
+        if self.connection.enable_offload():
+            log.info('UDP offload | gso %s | gro %s', self.connection.gso, self.connection.gro)
+        else:
+            log.warning('UDP offload is not supported, sending one segment per syscall')
 
     def run(self):
-        print(f'[!] Listening to {self.connection.ip}:{self.connection.port} for clients\n')
+        self.connection.metrics.install_signal_handler(self.metrics_path)
+
+        log.info('Listening to %s:%s for clients', self.connection.ip, self.connection.port)
         self.__listen_for_clients()
         self.__print_clients()
         self.__start_file_transfer()
+        log.info('Segment cache | %s hits | %s misses | %s bytes', self.cache.hits, self.cache.misses, self.cache.size)
+        self.connection.metrics.dump(self.metrics_path)
+        self.cache.clear()
+        for compressor in self.compressors.values():
+            compressor.close()
+        if self.__delta_executor is not None:
+            self.__delta_executor.shutdown(wait=True, cancel_futures=True)
+        for source in self.sources:
+            source.close()
         self.connection.socket.close()
 
     def __print_clients(self):
-        print(f'Client list: ')
+        log.info('Client list:')
         for client in self.clients:
-            print(f'- {client.ip}:{client.port}')
+            log.info('- %s:%s', client.ip, client.port)
 
     def __listen_for_clients(self):
-        print(f'[!] Listening to {self.connection.ip}:{self.connection.port} for clients\n')
+        log.info('Listening to %s:%s for clients', self.connection.ip, self.connection.port)
 
         while True:
             self.connection.socket.settimeout(BLOCKING)
@@ -59,10 +222,10 @@ class Server(Node):
             port = syn_message.port
             segment = syn_message.segment
 
-            if segment == Segment.syn(0):
+            if segment.is_syn() and segment.seq_num == 0:
                 self.clients.append(ListeningClient(ip, port))
 
-                print(f'[!] [Request] Received request from {ip}:{port}')
+                log.info('[Request] Received request from %s:%s', ip, port)
 
                 ack_message = MessageInfo(
                     ip=self.connection.ip,
@@ -72,65 +235,287 @@ class Server(Node):
 
                 self.connection.send(ip, port, ack_message)
 
+                flush_logging()
                 response = input(f'[?] [Request] Listen more? (y/n) ')
                 while response not in ['y', 'n']:
-                    print(f'[X] [Request] Please choose between (y) and (n)')
+                    log.warning('[Request] Please choose between (y) and (n)')
 
+                    flush_logging()
                     response = input(f'[?] [Request] Listen more? (y/n) ')
 
                 if response == 'n':
                     break
 
             else:
-                print(f'[X] [Request] Unknown segment received')
+                log.warning('[Request] Unknown segment received')
 
     def __start_file_transfer(self):
-        for client in self.clients:
-            self.__three_way_handshake(client)
-            self.__send_data(client)
-            self.__send_fin(client)
+        if self.mode in ['concurrent', 'broadcast']:
+            self.__serve_clients(self.clients)
+        else:
+            for client in self.clients:
+                self.__serve_clients([client])
+
+    def __serve_clients(self, clients: list[ListeningClient]):
+        sessions = {}
+
+        group = None
+        if self.mode == 'broadcast':
+            group = BroadcastGroup(
+                connection=self.connection,
+                total_segment=self.total_segments[0],
+                get_segment=functools.partial(self.__get_segment, 0, 0),
+                group=self.group,
+                congestion=create_congestion_control(self.congestion, self.max_window),
+                get_size=functools.partial(self.__get_payload_size, 0)
+            )
+
+        for client in clients:
+            session = ClientSession(client=client)
+            if group is not None:
+                session.sender = group.add_member(client.ip, client.port, session.rtt)
+
+            sessions[(client.ip, client.port)] = session
+
+            self.__three_way_handshake(session)
+
+        selector = selectors.DefaultSelector()
+        selector.register(self.connection.socket, selectors.EVENT_READ)
+        self.connection.socket.setblocking(False)
+
+        while True:
+            active = [session for session in sessions.values() if session.state != ClientSession.DONE]
+            if not active:
+                break
+
+            now = time.monotonic()
+            deadlines = [session.get_deadline() for session in active]
+            deadlines = [deadline for deadline in deadlines if deadline is not None]
+            timeout = max(0.0, min(deadlines) - now) if deadlines else None
+
+            if selector.select(timeout):
+                self.__receive_messages(sessions)
+
+            now = time.monotonic()
+            for session in active:
+                deadline = session.get_deadline()
+                if deadline is not None and deadline <= now:
+                    self.__handle_timeout(session)
+
+        selector.close()
+        self.connection.socket.setblocking(True)
+
+    def __receive_messages(self, sessions: dict):
+        while True:
+            try:
+                message = self.connection.listen()
+
+            except BlockingIOError:
+                return
+
+            except InvalidChecksumError as e:
+                log.warning('Checksum error: %s', e)
+                continue
+
+            session = sessions.get((message.ip, message.port))
+            if session is None:
+                log.warning('Unknown segment received from %s:%s', message.ip, message.port)
+                self.connection.release(message)
+                continue
+
+            self.__handle_segment(session, message.segment)
+            self.connection.release(message)
+
+    def __handle_segment(self, session: "ClientSession", segment: Segment):
+        client = session.client
+
+        if session.state == ClientSession.HANDSHAKE:
+            if segment.is_syn_ack():
+                log.info('[Handshake] Received SYN ACK response from %s:%s', client.ip, client.port)
+                session.sample_rtt()
+                self.__start_sender(session, HandshakeOptions.from_bytes(segment.payload))
+                self.__send_handshake_ack(session)
+                if session.state == ClientSession.DATA:
+                    self.__send_data(session)
+            else:
+                log.info('[Handshake] Unknown segment received from %s:%s', client.ip, client.port)
+
+        elif session.state == ClientSession.DELTA:
+            if segment.is_syn_ack():
+                self.__send_handshake_ack(session)
+
+        elif session.state == ClientSession.DATA:
+            if segment.is_syn_ack():
+                # Our handshake ACK was lost and the client is still waiting for it
+                self.__send_handshake_ack(session)
+            elif segment.is_ack():
+                session.handle_ack(segment)
+                self.__send_data(session)
+
+        elif session.state == ClientSession.FIN:
+            if segment.is_fin_ack():
+                log.info('[Final] Received FIN ACK response from %s:%s', client.ip, client.port)
+                session.sample_rtt()
+                log.info('File transfer to %s:%s completed', client.ip, client.port)
+                log.info('RTT to %s:%s | %s', client.ip, client.port, session.rtt)
+                log.info('Window to %s:%s | %s', client.ip, client.port, session.sender.congestion)
+                session.state = ClientSession.DONE
+            else:
+                log.warning('[Final] Unknown segment received from %s:%s', client.ip, client.port)
+
+    def __handle_timeout(self, session: "ClientSession"):
+        client = session.client
+
+        if session.state not in [ClientSession.DELTA, ClientSession.DATA]:
+            self.connection.metrics.get(client.ip, client.port).timeouts += 1
+
+        if session.state == ClientSession.HANDSHAKE:
+            log.warning('[Handshake] Timeout error: no SYN ACK from %s:%s', client.ip, client.port)
+            log.info('[Handshake] Retransmit SYN request to %s:%s', client.ip, client.port)
+            session.rtt.backoff()
+            self.__three_way_handshake(session, retransmit=True)
+
+        elif session.state == ClientSession.DELTA:
+            self.__poll_delta(session)
+
+        elif session.state == ClientSession.DATA:
+            session.sender.handle_timeout()
+            self.__send_data(session)
 
-    def __three_way_handshake(self, client: ListeningClient):
-        print(f'[!] [Handshake] Handshake to client at {client.ip}:{client.port}')
+        elif session.state == ClientSession.FIN:
+            log.warning('[Final] Timeout error: no FIN ACK from %s:%s', client.ip, client.port)
+            log.info('[Final] Retransmit FIN request to %s:%s', client.ip, client.port)
+            session.rtt.backoff()
+            self.__send_fin(session, retransmit=True)
+
+    def __three_way_handshake(self, session: "ClientSession", retransmit: bool = False):
+        client = session.client
+
+        log.info('[Handshake] Sending SYN request to %s:%s', client.ip, client.port)
 
         syn_message = MessageInfo(
             ip=self.connection.ip,
             port=self.connection.port,
-            segment=Segment.syn(0)
+            segment=Segment.syn(0, self.options.get_bytes())
         )
 
-        print(f'[!] [Handshake] Sending SYN request to {client.ip}:{client.port}')
-
         self.connection.send(client.ip, client.port, syn_message)
 
-        while True:
-            try:
-                print(f'[!] [Handshake] Waiting for response...')
-                self.connection.socket.settimeout(TIMEOUT)
-                syn_ack_message = self.connection.listen()
-
-                ip = syn_ack_message.ip
-                port = syn_ack_message.port
-                segment = syn_ack_message.segment
+        session.state = ClientSession.HANDSHAKE
+        session.start_timer(retransmit)
+
+    def __start_sender(self, session: "ClientSession", options: HandshakeOptions):
+        client = session.client
+        protocol = 'Selective Repeat' if options.mode == SELECTIVE_REPEAT else 'Go-Back-N'
+        log.info('[Handshake] Using %s with %s:%s', protocol, client.ip, client.port)
+
+        # A client that does not know about streams only gets the first file
+        streams = min(options.streams, len(self.sources))
+        if not options.manifest:
+            streams = next(
+                (stream for stream in range(streams) if isinstance(self.sources[stream], DirectorySource)),
+                streams
+            )
+        if streams < len(self.sources):
+            log.warning('[Handshake] %s:%s accepts %s of %s streams', client.ip, client.port, streams, len(self.sources))
+
+        # The streams share the window so together they are not more
+        # aggressive than a single transfer, and never keep more segments in
+        # flight than the receiver can buffer per stream
+        max_window = max(1, self.max_window // max(streams, 1))
+        if options.window:
+            max_window = min(max_window, options.window)
+
+        if isinstance(session.sender, GroupMember):
+            session.sender.selective = options.mode == SELECTIVE_REPEAT
+            congestion = session.sender.congestion
+            congestion.max_window = min(congestion.max_window, max_window)
+            return
+
+        starts = [min(options.resume.get(stream, 0), self.total_segments[stream]) for stream in range(streams)]
+        for stream, start in enumerate(starts):
+            if start > 0:
+                log.info('[Handshake] Resuming stream %s to %s:%s from segment %s', stream, client.ip, client.port, start)
+
+        codec = get_codec(options.compression) if self.options.compression else None
+        codec_id = codec.id if codec is not None else 0
+        if codec is not None:
+            log.info('[Handshake] Compressing with %s for %s:%s', codec.name, client.ip, client.port)
+            if codec_id not in self.compressors:
+                self.compressors[codec_id] = Compressor(codec)
+
+        total_segments = self.total_segments[:streams]
+        get_segments = [functools.partial(self.__get_segment, stream, codec_id) for stream in range(streams)]
+
+        # A client with an older copy of the only file gets the difference.
+        # Searching the file takes seconds on large ones, so it runs off the
+        # event loop and the sender starts once the result is ready
+        if options.signatures and streams == 1 and starts[0] == 0 and isinstance(self.sources[0], FileSource):
+            if self.__delta_executor is None:
+                self.__delta_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='delta')
+
+            log.info('[Delta] Computing the difference for %s:%s', client.ip, client.port)
+            session.pending = self.__delta_executor.submit(
+                DeltaSource, self.sources[0], Signatures.from_bytes(options.signatures)
+            )
+            session.on_delta = functools.partial(self.__start_delta_sender, session, options.mode, max_window)
+            return
+
+        session.sender = StreamMultiplexer([
+            self.__create_sender(
+                session, options.mode, total_segments[stream], get_segments[stream], max_window, starts[stream],
+                functools.partial(self.__get_payload_size, stream)
+            )
+            for stream in range(streams)
+        ])
+
+    def __start_delta_sender(self, session: "ClientSession", mode: int, max_window: int):
+        client = session.client
+        log.info(
+            '[Delta] %s:%s | %s bytes copied | %s bytes literal | %s bytes to send',
+            client.ip, client.port, session.delta.copied, session.delta.literal, session.delta.size
+        )
 
-                if segment == Segment.syn_ack():
-                    print(f'[!] [Handshake] Received SYN ACK response from {ip}:{port}')
-                    break
-                else:
-                    print(f'[!] [Handshake] Unknown segment received')
-                    print(f'[!] [Handshake] Retransmit SYN request to {client.ip}:{client.port}')
+        session.sender = StreamMultiplexer([
+            self.__create_sender(
+                session, mode, 1 + session.delta.total_segment,
+                functools.partial(self.__get_delta_segment, session), max_window, 0
+            )
+        ])
+
+    def __create_sender(
+            self, session: "ClientSession", mode: int, total_segment: int, get_segment, max_window: int, start: int,
+            get_size=None
+    ):
+        return create_sender(
+            mode,
+            connection=self.connection,
+            ip=session.client.ip,
+            port=session.client.port,
+            total_segment=total_segment,
+            get_segment=get_segment,
+            rtt=session.rtt,
+            congestion=create_congestion_control(self.congestion, max_window),
+            start=start,
+            get_size=get_size
+        )
 
-            except TimeoutError as e:
-                print(f'[X] [Handshake] Timeout error: {e}')
-                print(f'[!] [Handshake] Retransmit SYN request to {client.ip}:{client.port}')
+    def __poll_delta(self, session: "ClientSession"):
+        if not session.pending.done():
+            session.deadline = time.monotonic() + DELTA_POLL
+            return
 
-                self.connection.send(client.ip, client.port, syn_message)
+        session.delta = session.pending.result()
+        session.pending = None
+        session.on_delta()
+        session.on_delta = None
 
-            except InvalidChecksumError as e:
-                print(f'[X] [Handshake] Checksum error: {e}')
-                print(f'[!] [Handshake] Retransmit SYN request to {client.ip}:{client.port}')
+        session.state = ClientSession.DATA
+        session.deadline = None
+        self.__send_data(session)
 
-                self.connection.send(client.ip, client.port, syn_message)
+    def __send_handshake_ack(self, session: "ClientSession"):
+        client = session.client
 
         ack_message = MessageInfo(
             ip=self.connection.ip,
@@ -140,75 +525,28 @@ class Server(Node):
 
         self.connection.send(client.ip, client.port, ack_message)
 
-        print(f'[!] [Handshake] Sending ACK request to {client.ip}:{client.port}')
-        print(f'[!] [Handshake] Handshake completed')
-        print()
-
-    def __send_data(self, client: ListeningClient):
-        client_ip = client.ip
-        client_port = client.port
-
-        total_segment = ceil(self.file_size / PAYLOAD_SIZE) + 1
-        window_size = min(total_segment, WINDOW_SIZE)
-
-        seq_base = 0
-
-        on_transfer = 0
-        f = open(self.file_path, "rb")
-        while seq_base < total_segment:
-            while on_transfer < window_size:
-                if seq_base + on_transfer == 0:
-                    message_info = self.__get_metadata_message(client)
-                else:
-                    f.seek((seq_base + on_transfer - 1) * PAYLOAD_SIZE)
-                    payload = f.read(PAYLOAD_SIZE)
-
-                    segment = Segment(
-                        flags=SegmentFlag(MSG_FLAG),
-                        seq_num=seq_base + on_transfer,
-                        ack_num=seq_base,
-                        checksum=b'',
-                        payload=payload
-                    )
-
-                    segment.update_checksum()
-
-                    message_info = MessageInfo(
-                        ip=self.connection.ip,
-                        port=self.connection.port,
-                        segment=segment
-                    )
-
-                self.connection.send(client_ip, client_port, message_info)
-                print(f'[!] Sending segment {seq_base + on_transfer} to {client_ip}:{client_port}')
-
-                on_transfer += 1
-
-            self.connection.socket.settimeout(TIMEOUT)
-            while True:
-                try:
-                    ack_message = self.connection.listen()
-
-                    ack_num = ack_message.segment.ack_num
-
-                    print(f'[!] Received ACK response {ack_num} from {client_ip}:{client_port}')
-
-                    if ack_num == seq_base:
-                        print(f'[!] ACK received sequentially, sending the next segment')
-                        seq_base += 1
-                        on_transfer -= 1
-                    else:
-                        print(
-                            f'[X] ACK number does not match, retransmit {window_size} segments starting from {seq_base}')
-                        on_transfer = 0
-
-                except TimeoutError as e:
-                    on_transfer = 0
-                    print(f'[X] Timeout error: {e}')
-                    break
-        f.close()
+        if session.state == ClientSession.HANDSHAKE:
+            log.info('[Handshake] Sending ACK request to %s:%s', client.ip, client.port)
+            log.info('[Handshake] Handshake completed')
+
+            session.state = ClientSession.DATA
+            session.deadline = None
+
+            # The handshake is complete, data follows once the difference is
+            # ready
+            if session.pending is not None:
+                session.state = ClientSession.DELTA
+                session.deadline = time.monotonic() + DELTA_POLL
+
+    def __send_data(self, session: "ClientSession"):
+        session.sender.send_window()
+
+        if session.sender.is_done():
+            self.__send_fin(session)
+
+    def __send_fin(self, session: "ClientSession", retransmit: bool = False):
+        client = session.client
 
-    def __send_fin(self, client: ListeningClient):
         fin_message = MessageInfo(
             ip=client.ip,
             port=client.port,
@@ -216,63 +554,193 @@ class Server(Node):
         )
 
         self.connection.send(client.ip, client.port, fin_message)
+        log.info('[Final] Sending FIN request to %s:%s', client.ip, client.port)
+
+        session.state = ClientSession.FIN
+        session.start_timer(retransmit)
+
+    def __get_segment(self, stream: int, codec_id: int, seq_num: int) -> Segment:
+        key = (self.file_paths[stream], stream, seq_num, codec_id)
+        segment = self.cache.get(key)
+        if segment is not None:
+            return segment
+
+        headers = self.headers[stream]
+        if seq_num < len(headers):
+            segment = headers[seq_num]
+        else:
+            payload = self.sources[stream].get_payload(seq_num - len(headers))
+
+            compressed = None
+            if codec_id and self.__is_compressible(stream, codec_id):
+                compressed = self.compressors[codec_id].get((stream, seq_num), payload)
+                self.__count_compression(stream, codec_id, compressed)
+                self.__prefetch(stream, codec_id, seq_num + 1)
+
+            # ack_num is not read by receivers on data segments, so it is kept
+            # constant to make the wire image independent of the window state
+            if compressed is not None:
+                segment = Segment.data(seq_num, compressed, stream, compressed=True)
+            else:
+                segment = Segment.data(seq_num, payload, stream)
+
+        # Cached segments keep their checksum and a view of the mapped file,
+        # so a hit costs neither hashing nor a payload copy
+        self.cache.put(key, segment)
+
+        return segment
+
+    def __get_payload_size(self, stream: int, seq_num: int) -> int:
+        # Delivered bytes are file bytes as the client writes them, before
+        # compression and without the metadata or manifest
+        headers = self.headers[stream]
+        if seq_num < len(headers):
+            return 0
+
+        source = self.sources[stream]
+        offset = (seq_num - len(headers)) * source.payload_size
+
+        return min(source.payload_size, source.size - offset)
+
+    def __get_delta_segment(self, session: "ClientSession", seq_num: int) -> Segment:
+        key = ('delta', session.client.ip, session.client.port, seq_num)
+        segment = self.cache.get(key)
+        if segment is not None:
+            return segment
+
+        if seq_num == 0:
+            file_name, file_ext = self.__get_file_name(0)
+            segment = Segment.metadata(file_name, file_ext, delta=True)
+        else:
+            segment = Segment.data(seq_num, session.delta.get_payload(seq_num - 1))
+
+        self.cache.put(key, segment)
+
+        return segment
+
+    def __is_compressible(self, stream: int, codec_id: int) -> bool:
+        key = (stream, codec_id)
+        compressible = self.compressible.get(key)
+        if compressible is not None:
+            return compressible
+
+        # A few payloads spread over the stream tell whether compressing the
+        # rest is worth the CPU, media files are sent as they are. They are
+        # compressed by the pool and segments go out as they are until the
+        # verdict is in
+        sample = self.__samples.get(key)
+        if sample is None:
+            source = self.sources[stream]
+            indexes = sorted({
+                index * (source.total_segment - 1) // max(COMPRESSION_SAMPLES - 1, 1)
+                for index in range(COMPRESSION_SAMPLES)
+            }) if source.total_segment > 0 else []
+
+            self.__samples[key] = self.compressors[codec_id].sample([source.get_payload(index) for index in indexes])
+            return False
+
+        if not sample.done():
+            return False
+
+        raw_size, compressed_size = self.__samples.pop(key).result()
+        ratio = compressed_size / raw_size if raw_size else 1.0
+        compressible = ratio <= COMPRESSION_RATIO
+        log.info(
+            'Compression | stream %s | %s | sampled ratio %.2f | %s',
+            stream, CODECS[codec_id].name, ratio, 'enabled' if compressible else 'bypassed'
+        )
 
-        while True:
-            try:
-                print(f'[!] [Final] Waiting for response...')
-                self.connection.socket.settimeout(TIMEOUT)
-                fin_ack_message = self.connection.listen()
+        self.compressible[(stream, codec_id)] = compressible
+        self.__misses[(stream, codec_id)] = 0
 
-                ip = fin_ack_message.ip
-                port = fin_ack_message.port
-                segment = fin_ack_message.segment
+        return compressible
 
-                if segment == Segment.fin_ack():
-                    print(f'[!] [Final] Received FIN ACK response from {ip}:{port}')
-                    break
-                else:
-                    print(f'[X] [Final] Unknown segment received')
-                    print(f'[!] [Final] Retransmit FIN request to {client.ip}:{client.port}')
+    def __count_compression(self, stream: int, codec_id: int, compressed: Optional[bytes]):
+        # Content that stops compressing, like a media file inside a
+        # directory, turns compression off for the rest of the stream
+        misses = 0 if compressed is not None else self.__misses[(stream, codec_id)] + 1
+        self.__misses[(stream, codec_id)] = misses
 
-            except TimeoutError as e:
-                print(f'[X] [Final] Timeout error: {e}')
-                print(f'[!] [Final] Retransmit FIN request to {client.ip}:{client.port}')
+        if misses >= COMPRESSION_MISSES:
+            log.info('Compression | stream %s | %s | bypassed after %s incompressible segments', stream, CODECS[codec_id].name, misses)
+            self.compressible[(stream, codec_id)] = False
 
-                self.connection.send(client.ip, client.port, fin_message)
+    def __prefetch(self, stream: int, codec_id: int, seq_num: int):
+        # Segments the sender will ask for next are compressed in the
+        # background so the send loop only picks up the result
+        compressor = self.compressors[codec_id]
+        headers = self.headers[stream]
+        end = min(seq_num + COMPRESSION_AHEAD, self.total_segments[stream])
 
-            except InvalidChecksumError as e:
-                print(f'[X] [Final] Checksum error: {e}')
-                print(f'[!] [Final] Retransmit FIN request to {client.ip}:{client.port}')
+        for next_seq in range(max(seq_num, len(headers)), end):
+            key = (stream, next_seq)
+            if compressor.is_pending(key) or (self.file_paths[stream], stream, next_seq, codec_id) in self.cache:
+                continue
 
-                self.connection.send(client.ip, client.port, fin_message)
+            compressor.prefetch(key, self.sources[stream].get_payload(next_seq - len(headers)))
 
-        print(f'[!] File transfer to {client.ip}:{client.port} completed')
-        print()
+    def __get_header_segments(self, stream: int) -> list[Segment]:
+        source = self.sources[stream]
+        if isinstance(source, DirectorySource):
+            data = source.manifest.get_bytes()
 
-    def __get_metadata_message(self, client: ListeningClient):
-        split_file = self.file_path.split(".")
-        file_name = split_file[0].split("/")[-1]
-        file_ext = split_file[1]
-        metadata_message = MessageInfo(
-            ip=client.ip,
-            port=client.port,
-            segment=Segment.metadata(file_name, file_ext)
-        )
+            return [
+                Segment.manifest(seq_num, data[offset:offset + PAYLOAD_SIZE], stream)
+                for seq_num, offset in enumerate(range(0, len(data), PAYLOAD_SIZE))
+            ]
+
+        file_name, file_ext = self.__get_file_name(stream)
+
+        return [Segment.metadata(file_name, file_ext, stream)]
+
+    def __get_file_name(self, stream: int) -> tuple[str, str]:
+        # The client saves the file under this name, a file without an
+        # extension sends an empty one
+        file_name, file_ext = os.path.splitext(os.path.basename(self.file_paths[stream]))
 
-        return metadata_message
+        return file_name, file_ext[1:]
 
     def __del__(self):
         self.connection.socket.close()
 
 
 def main():
-    broadcast_port = int(sys.argv[1])
-    input_path = sys.argv[2]
+    parser = argparse.ArgumentParser()
+    parser.add_argument('broadcast_port', type=int)
+    parser.add_argument('input_paths', nargs='+')
+    parser.add_argument('--mode', choices=['sequential', 'concurrent', 'broadcast'], default='sequential')
+    parser.add_argument('--group', type=parse_address, default=None)
+    parser.add_argument('--protocol', choices=PROTOCOLS.keys(), default='gbn')
+    parser.add_argument('--congestion', choices=CONGESTION_CONTROLS.keys(), default='reno')
+    parser.add_argument('--max-window', type=int, default=MAX_WINDOW_SIZE)
+    parser.add_argument('--offload', action='store_true')
+    parser.add_argument('--compression', choices=COMPRESSIONS.keys(), default=None)
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE)
+    parser.add_argument('--metrics', default=None)
+    parser.add_argument('--log-level', choices=LEVELS.keys(), default=LOG_LEVEL)
+    parser.add_argument('--log-rate', type=float, default=LOG_RATE_LIMIT)
+    args = parser.parse_args()
+
+    if len(args.input_paths) > MAX_STREAMS:
+        parser.error(f'at most {MAX_STREAMS} input files are supported')
+    if args.mode == 'broadcast' and (len(args.input_paths) > 1 or os.path.isdir(args.input_paths[0])):
+        parser.error('broadcast mode sends a single input file')
+
+    setup_logging(args.log_level, args.log_rate)
 
     server = Server(
-        input_path=input_path,
+        input_paths=args.input_paths,
         ip="localhost",
-        port=broadcast_port
+        port=args.broadcast_port,
+        cache_size=args.cache_size,
+        mode=args.mode,
+        group=args.group,
+        protocol=PROTOCOLS[args.protocol],
+        congestion=args.congestion,
+        max_window=args.max_window,
+        offload=args.offload,
+        metrics_path=args.metrics,
+        compression=COMPRESSIONS.get(args.compression)
     )
 
     server.run()